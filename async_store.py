@@ -0,0 +1,242 @@
+from typing import Optional, Iterable, Tuple, Dict
+
+from sqlalchemy import select, delete
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from auth import PasswordHasher
+from user_state_cache import UserState, UserStateCache
+from util import load_config
+from store import (
+    User, WrongWord, config, get_database_url,
+    wrong_word_upsert, upsert_inserted, upserted_error_count, merge_wrong_word_increments,
+    wrong_word_batch_upsert, wrong_word_increment, word_indexes_update, BATCH_UPDATE_SIZE,
+    wrong_word_count_change, wrong_word_counts_refresh, wrong_list_query, wrong_word_to_dict
+)
+
+# 异步数据库连接，使用 aiomysql 驱动，连接池大小可在 [database] 中配置
+ASYNC_DATABASE_URL = get_database_url(config, driver="aiomysql")
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=int(config.get("pool_size", 10)),
+    max_overflow=int(config.get("max_overflow", 10)),
+    pool_timeout=float(config.get("pool_timeout", 10)),
+    pool_recycle=int(config.get("pool_recycle", 3600)),
+    pool_pre_ping=True
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+# 密码哈希进程池，进程数、排队上限和 bcrypt 代价因子可在 [auth] 中配置
+auth_config = load_config("auth", required=False)
+password_hasher = PasswordHasher(
+    workers=int(auth_config.get("hash_workers", 2)),
+    max_pending=int(auth_config.get("hash_max_pending", 64)),
+    rounds=int(auth_config.get("bcrypt_rounds", 12))
+)
+
+
+async def _load_user_state(username: str) -> Optional[UserState]:
+    """一次查询加载用户的单词索引和全部错词次数"""
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(User.current_word_index, WrongWord.word, WrongWord.error_count)
+            .select_from(User)
+            .outerjoin(WrongWord, WrongWord.username == User.username)
+            .where(User.username == username)
+        )).all()
+    if not rows:
+        return None
+    error_counts = {word: count for _, word, count in rows if word is not None}
+    return UserState(rows[0].current_word_index, error_counts)
+
+
+# 用户学习状态读穿缓存，默认关闭，在 [user_cache] 中开启（多 worker 部署时需要会话粘滞）
+user_cache_config = load_config("user_cache", required=False)
+user_state_cache = UserStateCache(
+    _load_user_state,
+    max_users=int(user_cache_config.get("max_users", 10000)),
+    ttl_seconds=float(user_cache_config.get("ttl_seconds", 60))
+) if user_cache_config.get("enabled", "false").lower() == "true" else None
+
+
+class AsyncUserStore:
+    """UserStore 的异步版本，接口保持一致，供 async 接口使用，不阻塞事件循环"""
+
+    @staticmethod
+    async def create_user(username: str, password: str) -> Optional[User]:
+        """创建新用户"""
+        async with AsyncSessionLocal() as db:
+            # 检查用户名是否已存在
+            existing = await db.scalar(select(User.id).where(User.username == username))
+            if existing:
+                return None
+
+            # 对密码进行加密，bcrypt 计算较慢，放到进程池中执行
+            password_hash = await password_hasher.hash(password)
+
+            user = User(
+                username=username,
+                password_hash=password_hash,
+                current_word_index=0
+            )
+            db.add(user)
+            await db.commit()
+            await db.refresh(user)
+            return user
+
+    @staticmethod
+    async def verify_user(username: str, password: str) -> Optional[User]:
+        """验证用户登录"""
+        async with AsyncSessionLocal() as db:
+            user = await db.scalar(select(User).where(User.username == username))
+        if not user:
+            return None
+
+        matched = await password_hasher.verify(password, user.password_hash)
+        return user if matched else None
+
+    @staticmethod
+    async def update_word_index(username: str, index: int) -> bool:
+        """更新用户的单词索引"""
+        async with AsyncSessionLocal() as db:
+            user = await db.scalar(select(User).where(User.username == username))
+            if not user:
+                return False
+
+            user.current_word_index = index
+            await db.commit()
+        if user_state_cache:
+            user_state_cache.set_word_index(username, index)
+        return True
+
+    @staticmethod
+    async def update_word_indexes(indexes: Dict[str, int]) -> int:
+        """批量更新多个用户的单词索引，返回更新的行数"""
+        items = list(indexes.items())
+        updated = 0
+        async with AsyncSessionLocal() as db:
+            try:
+                for start in range(0, len(items), BATCH_UPDATE_SIZE):
+                    chunk = dict(items[start:start + BATCH_UPDATE_SIZE])
+                    updated += (await db.execute(word_indexes_update(chunk))).rowcount
+                await db.commit()
+            except SQLAlchemyError as e:
+                await db.rollback()
+                raise e
+        if user_state_cache:
+            for username, index in items:
+                user_state_cache.set_word_index(username, index)
+        return updated
+
+    @staticmethod
+    async def get_word_index(username: str) -> Optional[int]:
+        """获取用户的当前单词索引"""
+        if user_state_cache:
+            state = await user_state_cache.get(username)
+            return state.current_word_index if state else None
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(select(User.current_word_index).where(User.username == username))
+
+    @staticmethod
+    async def add_to_wrong_list(username: str, word: str) -> Optional[int]:
+        """添加单词到错词本，如果已存在则增加错误次数，返回新的错误次数"""
+        async with AsyncSessionLocal() as db:
+            try:
+                result = await db.execute(wrong_word_upsert(username, word))
+                error_count = upserted_error_count(result)
+                if upsert_inserted(result):
+                    await db.execute(wrong_word_count_change(username, 1))
+                await db.commit()
+            except SQLAlchemyError as e:
+                await db.rollback()
+                raise e
+        if user_state_cache:
+            user_state_cache.set_error_count(username, word, error_count)
+        return error_count
+
+    @staticmethod
+    async def add_to_wrong_list_batch(increments: Iterable[Tuple[str, str, int]]) -> int:
+        """批量增加错误次数，参数和返回值同 UserStore.add_to_wrong_list_batch"""
+        rows = merge_wrong_word_increments(increments)
+        if not rows:
+            return 0
+        async with AsyncSessionLocal() as db:
+            try:
+                await db.execute(wrong_word_batch_upsert(rows))
+                await db.execute(wrong_word_counts_refresh({row["username"] for row in rows}))
+                await db.commit()
+            except SQLAlchemyError as e:
+                await db.rollback()
+                raise e
+        if user_state_cache:
+            for row in rows:
+                user_state_cache.add_error_count(row["username"], row["word"], row["error_count"])
+        return len(rows)
+
+    @staticmethod
+    async def remove_from_wrong_list(username: str, word: str) -> None:
+        """从错词本中移除单词"""
+        async with AsyncSessionLocal() as db:
+            try:
+                removed = (await db.execute(delete(WrongWord).where(
+                    WrongWord.username == username,
+                    WrongWord.word == word
+                ))).rowcount
+                if removed:
+                    await db.execute(wrong_word_count_change(username, -removed))
+                await db.commit()
+            except SQLAlchemyError as e:
+                await db.rollback()
+                raise e
+        if user_state_cache:
+            user_state_cache.remove_error_count(username, word)
+
+    @staticmethod
+    async def increase_wrong_count(username: str, word: str) -> None:
+        """增加单词的错误次数"""
+        async with AsyncSessionLocal() as db:
+            try:
+                await db.execute(wrong_word_increment(username, word))
+                await db.commit()
+            except SQLAlchemyError as e:
+                await db.rollback()
+                raise e
+        if user_state_cache:
+            user_state_cache.increment_error_count(username, word)
+
+    @staticmethod
+    async def get_wrong_list(username: str, page: int = 1, page_size: int = 10,
+                             cursor: Optional[str] = None) -> list:
+        """获取用户的错词列表，支持页码分页和游标分页（cursor 为空字符串表示第一页）"""
+        async with AsyncSessionLocal() as db:
+            result = await db.scalars(wrong_list_query(username, page_size, page, cursor))
+            return [wrong_word_to_dict(w) for w in result.all()]
+
+    @staticmethod
+    async def get_wrong_words_count(username: str) -> int:
+        """获取用户错词总数（users.wrong_word_count 计数）"""
+        if user_state_cache:
+            state = await user_state_cache.get(username)
+            return state.wrong_total if state else 0
+        async with AsyncSessionLocal() as db:
+            count = await db.scalar(select(User.wrong_word_count).where(User.username == username))
+            return count or 0
+
+    @staticmethod
+    async def get_word_error_count(username: str, word: str) -> int:
+        """获取用户某个单词的错误次数"""
+        if user_state_cache:
+            state = await user_state_cache.get(username)
+            return state.error_counts.get(word, 0) if state else 0
+        async with AsyncSessionLocal() as db:
+            count = await db.scalar(select(WrongWord.error_count).where(
+                WrongWord.username == username,
+                WrongWord.word == word
+            ))
+            return count or 0
+
+
+async def close_async_db():
+    """关闭异步连接池和密码哈希进程池"""
+    await async_engine.dispose()
+    password_hasher.shutdown()
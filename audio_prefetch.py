@@ -0,0 +1,191 @@
+"""
+单词音频后台预取
+
+学习者切换章节或快要学完已预取的单词时，把接下来 K 个单词放入预取队列，
+由后台任务提前合成音频，第一次播放时不再等待语音合成。
+
+- 同时合成的预取请求数有上限，且有按需请求在合成时暂停，按需请求优先
+- 已在队列中或已有音频的单词不会重复入队
+- 按需请求和预取同时请求同一个单词时只合成一次（AudioStore 内合并）
+
+也可以作为命令行工具，预先合成整本单词书的音频:
+    python audio_prefetch.py toefl.json --concurrency 2
+"""
+import argparse
+import asyncio
+import json
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+from audio_store import AudioStore
+
+
+class AudioPrefetcher:
+    def __init__(self, store: AudioStore, words: Sequence[str] = (), concurrency: int = 1,
+                 max_queue: int = 10000, window: int = 20, low_watermark: int = 5, max_users: int = 10000):
+        """
+        Args:
+            store: 音频存储
+            words: 单词书中按顺序排列的单词，用于按学习进度预取
+            concurrency: 同时进行的预取合成数，应小于语音合成的 max_concurrency，给按需请求留出余量
+            max_queue: 队列长度上限，超出的单词直接丢弃
+            window: 每次为用户预取的单词数 K
+            low_watermark: 用户距离已预取范围末尾不足该数量时继续预取
+            max_users: 记录预取范围的最大用户数
+        """
+        self.store = store
+        self.words = words
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.window = window
+        self.low_watermark = low_watermark
+        self.max_users = max_users
+
+        # 在事件循环中创建
+        self._queue: Optional["asyncio.Queue[str]"] = None
+        # 在队列中或正在合成的单词
+        self._queued: Set[str] = set()
+        # 用户名 -> 已预取的单词索引范围 [start, end)
+        self._prefetched: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+        self._workers: List[asyncio.Task] = []
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failures = 0
+
+    def enqueue(self, words: Iterable[str]) -> int:
+        """单词加入预取队列，跳过已有音频、已在队列中的单词，返回新入队的数量"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        added = 0
+        for word in words:
+            if not word or word in self._queued or self.store.contains(word):
+                continue
+            if self._queue.qsize() >= self.max_queue:
+                self.dropped += 1
+                continue
+            self._queue.put_nowait(word)
+            self._queued.add(word)
+            added += 1
+        if added:
+            self.enqueued += added
+            self._ensure_workers()
+        return added
+
+    def _set_window(self, username: str, start: int, end: int) -> None:
+        self._prefetched[username] = (start, end)
+        self._prefetched.move_to_end(username)
+        while len(self._prefetched) > self.max_users:
+            self._prefetched.popitem(last=False)
+
+    def prefetch_range(self, username: str, start: int) -> int:
+        """从 start 开始为用户预取接下来 window 个单词（切换章节、重置进度时调用）"""
+        end = min(start + self.window, len(self.words))
+        self._set_window(username, start, end)
+        return self.enqueue(self.words[start:end])
+
+    def maybe_prefetch(self, username: str, index: int) -> int:
+        """
+        用户学到 index 时，如果接近已预取范围的末尾，继续预取（下一个单词时调用）
+
+        index 不在已预取范围内（例如跳回前面的单词）时从 index 重新预取
+        """
+        window = self._prefetched.get(username)
+        if window is not None:
+            start, end = window
+            if start <= index < end - self.low_watermark:
+                return 0
+            if start <= index < end:
+                # 已预取的部分不再入队，只补上范围之后的单词
+                new_end = min(index + self.window, len(self.words))
+                self._set_window(username, index, new_end)
+                return self.enqueue(self.words[end:new_end])
+        return self.prefetch_range(username, index)
+
+    def _ensure_workers(self) -> None:
+        self._workers = [task for task in self._workers if not task.done()]
+        loop = asyncio.get_running_loop()
+        while len(self._workers) < self.concurrency:
+            self._workers.append(loop.create_task(self._run()))
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            word = await queue.get()
+            try:
+                # 有按需请求正在合成时先让路
+                await self.store.wait_on_demand_idle()
+                await self.store.prefetch(word)
+                self.completed += 1
+            except Exception as e:
+                self.failures += 1
+                print(f"预取音频失败 {word}: {e}")
+            finally:
+                self._queued.discard(word)
+                queue.task_done()
+
+    async def join(self) -> None:
+        """等待队列中的单词全部合成完成"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        """停止后台任务，丢弃尚未合成的单词"""
+        for task in self._workers:
+            task.cancel()
+        for task in self._workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+        self._queue = None
+        self._queued.clear()
+
+    def stats(self) -> dict:
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return {
+            "queued": queued,
+            "in_progress": len(self._queued) - queued,
+            "concurrency": self.concurrency,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "failures": self.failures,
+        }
+
+
+async def prewarm(words: List[str], concurrency: int) -> None:
+    from speech import async_tts
+    from util import load_config
+
+    audio_config = load_config("audio", required=False)
+    store = AudioStore(
+        lambda text: async_tts().synthesize(text),
+        root=audio_config.get("dir", "speech"),
+        max_bytes=int(audio_config.get("max_mb", 512)) * 1024 * 1024
+    )
+    prefetcher = AudioPrefetcher(store, concurrency=concurrency, max_queue=len(words))
+    added = prefetcher.enqueue(words)
+    print(f"共 {len(words)} 个单词，需要合成 {added} 个")
+    await prefetcher.join()
+    await prefetcher.stop()
+    print(f"预热完成: {prefetcher.stats()}，音频存储: {store.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预先合成单词书的全部音频")
+    parser.add_argument("books", nargs="+", help="单词书 JSON 文件，例如 toefl.json")
+    parser.add_argument("--concurrency", type=int, default=2, help="同时合成数，不超过 [xfyun] max_concurrency")
+    args = parser.parse_args()
+
+    words = []
+    for book in args.books:
+        with open(book, 'r', encoding='utf-8') as f:
+            words.extend(w["word"] for w in json.load(f))
+    asyncio.run(prewarm(words, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+单词音频文件存储
+
+- 文件名使用文本的 sha256，按前两级十六进制分目录: {root}/ab/cd/abcd....mp3，
+  不再直接用用户输入作为文件名
+- 先写临时文件再 os.replace 原子替换，读取方不会拿到写了一半的文件
+- 同一文本同时只合成一次，并发请求等待同一个结果
+- 总大小超过 max_bytes 时按最近使用顺序淘汰
+
+多个 worker 各自维护使用顺序：索引中没有的文件会先检查磁盘，其他 worker 已写入的文件直接收录，
+被其他 worker 淘汰的文件在下次请求时重新合成。
+旧版直接以文本命名的 {root}/{text}.mp3 不再使用，也不计入总大小，可以手动删除。
+"""
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from singleflight import SingleFlight
+
+# 超过该时间的临时文件视为写入中断的残留
+STALE_TMP_SECONDS = 3600
+
+_SHARD_DIR = re.compile(r"^[0-9a-f]{2}$")
+_AUDIO_FILE = re.compile(r"^[0-9a-f]{64}\.mp3$")
+
+
+def audio_path(root: str, text: str) -> str:
+    """文本对应的音频文件路径"""
+    digest = hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+    return os.path.join(root, digest[:2], digest[2:4], digest + ".mp3")
+
+
+def write_audio(path: str, audio: bytes) -> None:
+    """先写临时文件再原子替换"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(audio)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class AudioStore:
+    def __init__(self, synthesize: Callable[[str], Awaitable[bytes]],
+                 root: str = "speech", max_bytes: int = 512 * 1024 * 1024):
+        """
+        Args:
+            synthesize: 合成函数，参数为文本，返回 mp3 音频数据
+            root: 存储目录
+            max_bytes: 音频文件总大小上限
+        """
+        self.synthesize = synthesize
+        self.root = root
+        self.max_bytes = max_bytes
+        self._generations = SingleFlight()
+        # 路径 -> 文件大小，按最近使用顺序排列
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.evictions = 0
+        self.bytes_served = 0
+        self.bytes_written = 0
+        self.prefetched = 0
+        # 正在等待合成的按需请求数，预取在有按需请求时让路
+        self.on_demand_waiting = 0
+        self._on_demand_idle: Optional[asyncio.Event] = None
+
+        self._scan()
+
+    def _scan(self) -> None:
+        """加载分目录中已有的音频文件，按修改时间作为最近使用顺序，清理残留的临时文件"""
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            shards = os.path.relpath(dirpath, self.root).split(os.sep)
+            if len(shards) != 2 or not all(_SHARD_DIR.match(shard) for shard in shards):
+                continue
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                stat = os.stat(path)
+                if filename.endswith(".tmp"):
+                    if time.time() - stat.st_mtime > STALE_TMP_SECONDS:
+                        os.remove(path)
+                elif _AUDIO_FILE.match(filename):
+                    files.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._files[path] = size
+            self.total_bytes += size
+
+    def path_for(self, text: str) -> str:
+        return audio_path(self.root, text)
+
+    def _lookup(self, path: str) -> Optional[int]:
+        """返回磁盘上音频文件的大小，并同步索引：收录其他 worker 写入的文件，移除已被删除的文件"""
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            self.total_bytes -= self._files.pop(path, 0)
+            return None
+        if path not in self._files:
+            self._files[path] = size
+            self.total_bytes += size
+            self._evict()
+        return size
+
+    def contains(self, text: str) -> bool:
+        return self._lookup(self.path_for(text)) is not None
+
+    def _idle_event(self) -> asyncio.Event:
+        if self._on_demand_idle is None:
+            self._on_demand_idle = asyncio.Event()
+            self._on_demand_idle.set()
+        return self._on_demand_idle
+
+    async def wait_on_demand_idle(self) -> None:
+        """等待所有按需合成完成"""
+        await self._idle_event().wait()
+
+    async def get(self, text: str) -> str:
+        """返回文本对应的音频文件路径，不存在时合成并保存"""
+        path = self.path_for(text)
+        size = self._lookup(path)
+        if size is not None:
+            self._files.move_to_end(path)
+            self.hits += 1
+            self.bytes_served += size
+            return path
+        self.misses += 1
+        idle = self._idle_event()
+        self.on_demand_waiting += 1
+        idle.clear()
+        try:
+            audio_path = await self._generations.do(path, lambda: self._generate(text, path))
+            self.bytes_served += self._files.get(audio_path, 0)
+            return audio_path
+        finally:
+            self.on_demand_waiting -= 1
+            if not self.on_demand_waiting:
+                idle.set()
+
+    async def read(self, text: str) -> bytes:
+        """返回文本对应的音频数据；文件在读取前被其他 worker 淘汰时重新获取一次"""
+        loop = asyncio.get_running_loop()
+        path = await self.get(text)
+        try:
+            return await loop.run_in_executor(None, _read_file, path)
+        except FileNotFoundError:
+            path = await self.get(text)
+            return await loop.run_in_executor(None, _read_file, path)
+
+    async def prefetch(self, text: str) -> bool:
+        """预先合成音频，不计入命中统计，返回是否新合成了音频"""
+        path = self.path_for(text)
+        if self._lookup(path) is not None:
+            return False
+        await self._generations.do(path, lambda: self._generate(text, path))
+        self.prefetched += 1
+        return True
+
+    async def _generate(self, text: str, path: str) -> str:
+        audio = await self.synthesize(text.strip())
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, write_audio, path, audio)
+        self.generated += 1
+        self.bytes_written += len(audio)
+
+        self.total_bytes += len(audio) - self._files.pop(path, 0)
+        self._files[path] = len(audio)
+        self._evict()
+        return path
+
+    def _evict(self) -> None:
+        # 至少保留刚写入的文件
+        while self.total_bytes > self.max_bytes and len(self._files) > 1:
+            path, size = self._files.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "files": len(self._files),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0,
+            "generated": self.generated,
+            "prefetched": self.prefetched,
+            "evictions": self.evictions,
+            "bytes_served": self.bytes_served,
+            "bytes_written": self.bytes_written,
+            "generating": self._generations.stats()["in_flight"],
+        }
@@ -0,0 +1,141 @@
+"""
+登录认证相关的性能优化
+
+- PasswordHasher: bcrypt 计算放到有界进程池中执行，不阻塞事件循环；排队的请求超过
+  max_pending 时直接拒绝（PasswordHasherBusy），避免登录高峰把所有请求都拖慢
+- VerifiedTokenCache: 已验证过签名的 JWT 的 LRU 缓存，在令牌过期前重复请求不再验签
+"""
+import asyncio
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import bcrypt
+
+
+def _hash_password(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check_password(password: bytes, password_hash: bytes) -> bool:
+    return bcrypt.checkpw(password, password_hash)
+
+
+class PasswordHasherBusy(Exception):
+    """等待计算的密码哈希请求过多"""
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = 2, max_pending: int = 64, rounds: int = 12):
+        """
+        Args:
+            workers: 进程池大小，为 0 时使用事件循环的默认线程池（bcrypt 计算时会释放 GIL）
+            max_pending: 同时计算和排队的最大请求数，超过时拒绝
+            rounds: 新密码的 bcrypt 代价因子，已有密码按其自身的代价因子验证
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._executor: Optional[Executor] = None
+
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    def start(self) -> None:
+        """
+        创建进程池，应在应用启动时、加载模型之前调用
+
+        子进程使用 spawn 方式启动：fork 会继承模型加载线程、torch 和事件循环持有的锁，子进程可能死锁
+        """
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def _get_executor(self) -> Optional[Executor]:
+        self.start()
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy("登录请求过多，请稍后再试")
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - start
+
+    async def hash(self, password: str) -> str:
+        """生成密码哈希"""
+        password_hash = await self._run(_hash_password, password.encode('utf-8'), self.rounds)
+        return password_hash.decode('utf-8')
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        """验证密码"""
+        return await self._run(_check_password, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_seconds * 1000 / self.completed, 2) if self.completed else 0,
+        }
+
+
+class VerifiedTokenCache:
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[str]:
+        """返回已验证令牌的用户名，未缓存或已过期时返回 None"""
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        username, expires_at = entry
+        if time.time() >= expires_at:
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return username
+
+    def put(self, token: str, username: str, expires_at: float) -> None:
+        """缓存验证通过的令牌，expires_at 为令牌的 exp（Unix 时间戳）"""
+        self._entries[token] = (username, expires_at)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0,
+        }
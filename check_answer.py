@@ -1,83 +1,235 @@
 from text_similarity_bert import BertSimilarity
-from concurrent.futures import ThreadPoolExecutor
-from typing import List
-from open_ai import calculate_similarity_openai
+from typing import List, Optional
+from open_ai import calculate_similarity_openai_async, async_azure_openai, BatchingLLMGrader
 import asyncio
 from functools import partial
 import json
 import os
+import threading
+import time
+import numpy as np
+from embedding_index import MeaningEmbeddingIndex
+from inference_batcher import EmbeddingBatcher
+from inference_server import InferenceClient, DEFAULT_SOCKET_PATH
+from embedding_cache import EmbeddingCache, CachedEncoder
+from score_cache import create_score_cache, make_cache_key
+from lexical_grader import LexicalGrader
+from singleflight import SingleFlight
+from util import split_meanings, load_config
 
-similarity = BertSimilarity()
+# 模型在后台线程中加载，导入本模块不会加载 torch 和模型
+similarity = None
+_model_lock = threading.Lock()
+model_status = {"loaded": False, "warmed_up": False, "error": None}
 
-# 创建缓存文件路径
-CACHE_FILE = "similarity_cache.json"
+# 释义片段向量索引目录，由 embedding_index.py 离线生成
+MEANING_INDEX_DIR = os.path.join("models", "meaning_index")
+meaning_index = None
 
-# 加载缓存
-def load_cache():
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+def get_similarity() -> BertSimilarity:
+    """获取模型实例，尚未加载时在当前线程加载（后台加载进行中则等待其完成）"""
+    global similarity
+    if similarity is None:
+        with _model_lock:
+            if similarity is None:
+                similarity = BertSimilarity()
+                model_status["loaded"] = True
+    return similarity
 
-# 保存缓存
-def save_cache(cache):
-    with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(cache, f, ensure_ascii=False, indent=2)
+def _encode(texts):
+    return get_similarity().get_text_embeddings(texts)
 
-# 初始化缓存
-similarity_cache = load_cache()
+# 动态微批处理，把并发请求的编码合并成一次前向计算
+# mode=remote 时不在本进程加载模型，编码请求发给 inference_server.py 共享推理服务
+bert_config = load_config("bert", required=False)
+remote_inference = bert_config.get("mode", "local") == "remote"
+if remote_inference:
+    embedding_batcher = InferenceClient(
+        bert_config.get("socket_path", DEFAULT_SOCKET_PATH),
+        pool_size=int(bert_config.get("socket_pool_size", 4))
+    )
+else:
+    embedding_batcher = EmbeddingBatcher(
+        _encode,
+        max_batch_size=int(bert_config.get("batch_max_size", 32)),
+        max_wait_ms=float(bert_config.get("batch_max_wait_ms", 5))
+    )
+
+# 用户答案向量缓存，相同答案不再重复编码
+embedding_cache = EmbeddingCache(
+    max_entries=int(bert_config.get("embedding_cache_size", 50000)),
+    dtype=bert_config.get("embedding_cache_dtype", "float16")
+)
+embedding_cache_path = bert_config.get("embedding_cache_path", "")
+embedding_batcher = CachedEncoder(embedding_batcher, embedding_cache)
+inference_backend = None
 
-def compare_single_meaning(answer: str, meaning: str) -> float:
-    """比较单个含义与答案的相似度"""
-    return similarity.calculate_similarity(answer.strip(), meaning.strip()) * 100
+def _wait_for_inference_server(timeout: float = 300) -> str:
+    """等待共享推理服务就绪，返回其推理后端标识"""
+    deadline = time.monotonic() + timeout
+    while True:
+        status = embedding_batcher.ping()
+        if status.get("ready"):
+            return status["backend"]
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"推理服务未就绪: {status.get('error', '预热中')}")
+        time.sleep(1)
 
-async def check_similarity(answer: str, correct_meaning: str) -> float:
+def load_model(meanings, warmup_size: int = 32):
     """
-    多线程计算答案与标准答案的相似度
+    加载模型和释义片段向量索引，并用有代表性的释义预热
+
+    Args:
+        meanings: 单词书中按顺序排列的释义
+        warmup_size: 预热使用的释义片段数量
+    """
+    global meaning_index, inference_backend
+    try:
+        if remote_inference:
+            inference_backend = _wait_for_inference_server()
+            meaning_index = MeaningEmbeddingIndex.load(MEANING_INDEX_DIR, meanings, inference_backend)
+            if embedding_cache_path:
+                embedding_cache.load(embedding_cache_path, inference_backend)
+            model_status["warmed_up"] = True
+            print(f"共享推理服务已就绪，推理后端: {inference_backend}")
+            return
+
+        model = get_similarity()
+        inference_backend = model.backend.identity
+        meaning_index = MeaningEmbeddingIndex.load(MEANING_INDEX_DIR, meanings, inference_backend)
+        if embedding_cache_path:
+            embedding_cache.load(embedding_cache_path, inference_backend)
+        samples = model.warm_up(meanings, warmup_size)
+        model_status["warmed_up"] = True
+        print(f"模型预热完成，预热样本数: {samples}")
+    except Exception as e:
+        model_status["error"] = str(e)
+        print(f"模型加载失败: {e}")
+
+def start_model_loading(meanings):
+    """在后台线程中加载并预热模型，不阻塞应用启动"""
+    thread = threading.Thread(target=load_model, args=(meanings,), name="bert-loader", daemon=True)
+    thread.start()
+    return thread
+
+def is_model_ready() -> bool:
+    """模型是否已加载并完成预热"""
+    return model_status["warmed_up"]
+
+async def close_clients():
+    """关闭判分使用的网络客户端，并保存答案向量缓存"""
+    if llm_grader:
+        await llm_grader.close()
+    await async_azure_openai.aclose()
+    if embedding_cache_path and inference_backend:
+        embedding_cache.save(embedding_cache_path, inference_backend)
+
+async def open_score_cache():
+    """打开分数缓存数据库（建表、导入旧缓存），在应用启动时调用"""
+    await score_cache.open_async()
+
+def score_cache_available() -> bool:
+    """分数缓存是否可用"""
+    return score_cache.is_available()
+
+def meaning_index_loaded() -> bool:
+    """释义片段向量索引是否已加载"""
+    return meaning_index is not None
+
+# 相似度分数缓存：进程内 LRU + SQLite 持久化
+score_cache = create_score_cache()
+
+# 词面快速判分，在调用模型之前处理完全一致、包含和高重合度的答案
+grading_config = load_config("grading", required=False)
+lexical_grader = LexicalGrader(
+    overlap_threshold=float(grading_config.get("lexical_overlap_threshold", 0.8))
+) if grading_config.get("lexical_enabled", "true").lower() == "true" else None
+
+# 分级判分阈值：BERT 分数高于 accept_above 或低于 reject_below 时不再调用大模型
+cascade_enabled = grading_config.get("cascade_enabled", "true").lower() == "true"
+bert_accept_above = float(grading_config.get("bert_accept_above", 95))
+bert_reject_below = float(grading_config.get("bert_reject_below", 60))
+cascade_stats = {"bert_accepted": 0, "bert_rejected": 0, "llm_calls": 0}
+
+# 批量大模型判分，短时间窗口内的判分请求合并成一次请求
+openai_config = load_config("azure_openai", required=False)
+llm_grader = BatchingLLMGrader(
+    max_batch_size=int(openai_config.get("batch_max_size", 20)),
+    max_wait_ms=float(openai_config.get("batch_max_wait_ms", 50))
+) if openai_config.get("batch_enabled", "false").lower() == "true" else None
+
+def _grade_with_llm(answer: str, correct_meaning: str):
+    if llm_grader:
+        return llm_grader.grade(answer, correct_meaning)
+    return calculate_similarity_openai_async(answer, correct_meaning)
+
+# 合并相同 (答案, 释义) 的并发判分请求
+grading_flight = SingleFlight()
+
+class GradingUnavailable(Exception):
+    """BERT 和大模型都没有给出分数"""
+
+async def check_similarity(answer: str, correct_meaning: str) -> Optional[float]:
+    """
+    批量计算答案与标准答案的相似度
+    
+    用户答案只编码一次；标准答案的各个含义优先从预计算索引中读取，
+    否则和答案一起进入同一批次编码，最后用一次矩阵乘法得到所有余弦相似度
     
     Args:
         answer: 用户输入的答案
         correct_meaning: 正确答案（可能包含多个含义，用分号分隔）
-        threshold: 相似度阈值，默认0.8
         
     Returns:
-        bool: 是否匹配成功
+        float: 与各个含义相似度的最大值（0-100），编码失败时返回 None
     """
     # 分割多个含义
-    meanings = [m for m in correct_meaning
-                .replace('；', ';')
-                .replace(',', ';')
-                .replace('，', ';')
-                .split(';') if m.strip()]
+    meanings = split_meanings(correct_meaning)
     
     if not meanings:
         return False
-        
-    # 使用线程池并行计算相似度
-    with ThreadPoolExecutor(max_workers=min(len(meanings), 5)) as executor:
-        # 提交所有比较任务
-        future_to_meaning = {
-            executor.submit(compare_single_meaning, answer, meaning): meaning 
-            for meaning in meanings
-        }
-        # 获取所有相似度结果
-        similarities = []
-        for future in future_to_meaning:
-            try:
-                similarity_score = future.result()
-                similarities.append(similarity_score)
-            except Exception as e:
-                print(f"计算相似度时发生错误: {e}")
-                continue
-    
-    # 如果没有有效的相似度结果，返回False
-    if not similarities:
-        return False
-    # 返回最大相似度是否超过阈值
-    return max(similarities)
+
+    try:
+        segment_vectors = meaning_index.lookup(correct_meaning) if meaning_index else None
+        if segment_vectors is not None:
+            answer_vector = await embedding_batcher.encode(answer.strip())
+        else:
+            # 答案走向量缓存，释义片段不缓存；两者并发提交，由批处理合并成同一次前向计算
+            answer_vector, segment_vectors = await asyncio.gather(
+                embedding_batcher.encode(answer.strip()),
+                embedding_batcher.encode_many(meanings)
+            )
+    except Exception as e:
+        print(f"计算相似度时发生错误: {e}")
+        return None
+
+    # 向量已归一化，点积即余弦相似度
+    scores = np.asarray(segment_vectors) @ answer_vector
+    return float(scores.max()) * 100
+
+def _cascade_metrics() -> dict:
+    avoided = cascade_stats["bert_accepted"] + cascade_stats["bert_rejected"]
+    total = avoided + cascade_stats["llm_calls"]
+    return {
+        **cascade_stats,
+        "enabled": cascade_enabled,
+        "bert_accept_above": bert_accept_above,
+        "bert_reject_below": bert_reject_below,
+        "llm_calls_avoided": avoided,
+        "llm_avoided_ratio": round(avoided / total, 4) if total else 0,
+    }
+
+def get_grading_metrics() -> dict:
+    """判分相关的运行指标"""
+    return {
+        "bert_batcher": embedding_batcher.stats(),
+        "score_cache": score_cache.stats(),
+        "lexical": lexical_grader.stats() if lexical_grader else None,
+        "cascade": _cascade_metrics(),
+        "openai": async_azure_openai.stats(),
+        "llm_batcher": llm_grader.stats() if llm_grader else None,
+        "singleflight": grading_flight.stats(),
+    }
 
 # 使用示例
 async def check_answer_by_all_means(answer: str, correct_meaning: str) -> bool:
@@ -93,31 +245,62 @@ async def check_answer_by_all_means(answer: str, correct_meaning: str) -> bool:
     """
     if not answer or not correct_meaning:
         return False
+
+    # 词面快速判分，有把握时直接返回，不调用模型
+    if lexical_grader:
+        lexical_score = lexical_grader.grade(answer, correct_meaning)
+        if lexical_score is not None:
+            print(f"词面快速判分: {lexical_score}")
+            return lexical_score
     
-    # 生成缓存key
-    cache_key = f"{answer}@{correct_meaning}"
+    # 生成缓存key，答案去掉首尾空白和标点
+    cache_key = make_cache_key(answer, correct_meaning)
     
     # 检查缓存
-    if cache_key in similarity_cache:
+    cached_score = await score_cache.get_async(cache_key)
+    if cached_score is not None:
         print("使用缓存的相似度分数")
-        return similarity_cache[cache_key]
+        return cached_score
     
-    # 将同步函数包装成异步函数
-    async def run_sync_in_thread(func, *args):
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, func, *args)
-    
-    # 并发执行两个相似度计算
-    num1, num2 = await asyncio.gather(
-        check_similarity(answer, correct_meaning),
-        run_sync_in_thread(calculate_similarity_openai, answer, correct_meaning)
+    # 相同答案的并发请求只计算一次，结果写入缓存后共享给所有等待者
+    return await grading_flight.do(
+        cache_key, lambda: _grade_with_models(answer, correct_meaning, cache_key)
     )
+
+async def _grade_with_models(answer: str, correct_meaning: str, cache_key: str) -> float:
+    """调用 BERT（以及必要时的大模型）判分，并写入缓存"""
+    num2 = None
+    llm_called = True
+    if not cascade_enabled:
+        # 并发执行两个相似度计算
+        num1, num2 = await asyncio.gather(
+            check_similarity(answer, correct_meaning),
+            _grade_with_llm(answer, correct_meaning)
+        )
+    else:
+        # 分级判分：BERT 足够确定时直接采用，只有不确定区间的答案才调用大模型
+        # BERT 失败（返回 None）时不能当作确定的拒绝，交给大模型判分
+        num1 = await check_similarity(answer, correct_meaning)
+        if num1 is not None and num1 >= bert_accept_above:
+            cascade_stats["bert_accepted"] += 1
+            llm_called = False
+        elif num1 is not None and num1 <= bert_reject_below:
+            cascade_stats["bert_rejected"] += 1
+            llm_called = False
+        else:
+            num2 = await _grade_with_llm(answer, correct_meaning)
+    if llm_called:
+        cascade_stats["llm_calls"] += 1
     
     print(f"bert 模型打分: {num1}, openai 打分: {num2}")
-    similarity_score = min(num1, num2)
+    scores = [score for score in (num1, num2) if score is not None]
+    if not scores:
+        raise GradingUnavailable("判分模型暂时不可用，请稍后再试")
+    # 大模型未调用或调用失败时使用 BERT 分数，BERT 失败时使用大模型分数
+    similarity_score = min(scores)
     
-    # 保存到缓存
-    similarity_cache[cache_key] = similarity_score
-    save_cache(similarity_cache)
+    # 只缓存调用的模型都正常返回的分数，临时故障的结果不写入共享缓存
+    if num1 is not None and (num2 is not None or not llm_called):
+        await score_cache.set_async(cache_key, similarity_score)
     
-    return similarity_score
\ No newline at end of file
+    return similarity_score
@@ -0,0 +1,138 @@
+"""
+用户答案向量缓存
+
+学习者的答案重复率很高（放弃、异常、在船上 ...），缓存 答案原文 -> 归一化向量，
+相同的答案不再重复编码。只缓存学习者答案，释义片段不进入缓存。
+向量以紧凑的 numpy float16/float32 数组保存，可选在进程退出时保存到磁盘，启动时加载。
+启动时的加载在模型加载线程中进行，所有对缓存字典的访问都持有锁。
+"""
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int = 50000, dtype: str = "float16"):
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return vector.astype(np.float32)
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        vector = np.asarray(vector, dtype=self.dtype).copy()
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def memory_bytes(self) -> int:
+        """向量和 key 占用的字节数（不含字典本身的开销）"""
+        with self._lock:
+            return sum(v.nbytes + len(k.encode("utf-8")) for k, v in self._entries.items())
+
+    def save(self, path: str, backend: str = "") -> None:
+        """保存到磁盘（npz），按最近使用顺序保存，backend 记录生成向量的推理后端"""
+        with self._lock:
+            if not self._entries:
+                return
+            keys = list(self._entries.keys())
+            vectors = np.stack(list(self._entries.values()))
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # 每个进程写自己的临时文件，多个 worker 同时退出时不会互相覆盖
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp.npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, backend=np.array(backend), keys=np.array(keys), vectors=vectors)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        print(f"答案向量缓存已保存 {len(keys)} 条: {path}")
+
+    def load(self, path: str, backend: str = "") -> int:
+        """从磁盘加载，文件不存在、损坏或推理后端不一致时忽略；加载期间写入的条目优先保留"""
+        if not os.path.exists(path):
+            return 0
+        loaded: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        try:
+            with np.load(path) as data:
+                if str(data["backend"]) != backend:
+                    print(f"答案向量缓存由 {data['backend']} 后端生成，与当前后端 {backend} 不一致，忽略: {path}")
+                    return 0
+                for key, vector in zip(data["keys"], data["vectors"]):
+                    loaded[str(key)] = np.asarray(vector, dtype=self.dtype)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"加载答案向量缓存失败: {e}")
+            return 0
+
+        with self._lock:
+            # 已在内存中的条目比文件中的更新，放在最近使用的一端
+            for key, vector in self._entries.items():
+                loaded[key] = vector
+                loaded.move_to_end(key)
+            while len(loaded) > self.max_entries:
+                loaded.popitem(last=False)
+            self._entries = loaded
+            count = len(loaded)
+        print(f"答案向量缓存已加载 {count} 条: {path}")
+        return count
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "dtype": self.dtype.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0,
+            "memory_bytes": self.memory_bytes(),
+        }
+
+
+class CachedEncoder:
+    """
+    给编码器（EmbeddingBatcher 或 InferenceClient）加上答案向量缓存
+    接口与被包装的编码器一致 (encode / encode_many / stats)
+
+    encode 用于学习者答案，按原文缓存；encode_many 用于释义片段，直接交给编码器，不进入缓存
+    """
+
+    def __init__(self, encoder, cache: EmbeddingCache):
+        self.encoder = encoder
+        self.cache = cache
+
+    async def encode(self, text: str) -> np.ndarray:
+        vector = self.cache.get(text)
+        if vector is None:
+            vector = await self.encoder.encode(text)
+            self.cache.put(text, vector)
+        return vector
+
+    async def encode_many(self, texts: Sequence[str]) -> np.ndarray:
+        return await self.encoder.encode_many(texts)
+
+    def stats(self) -> dict:
+        return {**self.encoder.stats(), "embedding_cache": self.cache.stats()}
+
+    def __getattr__(self, name):
+        return getattr(self.encoder, name)
@@ -0,0 +1,122 @@
+"""
+释义片段向量索引
+
+离线把单词书中每个 chinese_meaning 拆分后的片段用 BertSimilarity 编码，
+保存成 float32 矩阵（mmap 加载）和 片段 -> 单词 的偏移表。
+判分时只需要对用户答案做一次前向计算，再和对应行做向量点积。
+
+文件:
+    embeddings.npy : (片段数, 向量维度) float32，已归一化
+    offsets.npy    : (单词数 + 1,) int64，第 i 个单词的片段是 offsets[i]:offsets[i + 1]
+    meta.json      : 模型名、推理后端（含模型文件标识）、维度、单词书校验和
+
+用法:
+    python embedding_index.py toefl.json models/meaning_index
+"""
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from util import split_meanings
+
+EMBEDDINGS_FILE = "embeddings.npy"
+OFFSETS_FILE = "offsets.npy"
+META_FILE = "meta.json"
+
+
+def meanings_checksum(meanings: List[Optional[str]]) -> str:
+    """计算单词书释义的校验和，用来判断索引是否过期"""
+    digest = hashlib.sha1()
+    for meaning in meanings:
+        digest.update((meaning or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def build_index(meanings: List[Optional[str]], similarity, output_dir: str, batch_size: int = 64) -> None:
+    """编码所有释义片段并写出索引文件"""
+    segments = []
+    offsets = [0]
+    for meaning in meanings:
+        segments.extend(split_meanings(meaning))
+        offsets.append(len(segments))
+
+    print(f"开始编码释义片段: 单词数 {len(meanings)}, 片段数 {len(segments)}")
+    embeddings = similarity.get_text_embeddings(segments, batch_size=batch_size)
+    matrix = np.asarray(embeddings, dtype=np.float32)
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, EMBEDDINGS_FILE), matrix)
+    np.save(os.path.join(output_dir, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(output_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            "model": similarity.model_name,
+            "backend": similarity.backend.name,
+            "backend_id": similarity.backend.identity,
+            "dim": int(matrix.shape[1]),
+            "words": len(meanings),
+            "segments": len(segments),
+            "checksum": meanings_checksum(meanings),
+        }, f, ensure_ascii=False, indent=2)
+    print(f"释义向量索引已生成: {output_dir}")
+
+
+class MeaningEmbeddingIndex:
+    """mmap 加载的释义片段向量索引，按完整释义文本查找对应的片段向量"""
+
+    def __init__(self, matrix: np.ndarray, offsets: np.ndarray, meanings: List[Optional[str]]):
+        self.matrix = matrix
+        self.offsets = offsets
+        self._rows: Dict[str, Tuple[int, int]] = {}
+        for i, meaning in enumerate(meanings):
+            if meaning and meaning not in self._rows:
+                self._rows[meaning] = (int(offsets[i]), int(offsets[i + 1]))
+
+    @classmethod
+    def load(cls, index_dir: str, meanings: List[Optional[str]],
+             backend: Optional[str] = None) -> Optional["MeaningEmbeddingIndex"]:
+        """
+        加载索引，文件不存在、与当前单词书或推理后端不一致时返回 None
+
+        backend 为 InferenceBackend.identity，onnx 后端包含模型文件，fp32 和 int8 模型的索引不会混用
+        """
+        meta_path = os.path.join(index_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("checksum") != meanings_checksum(meanings):
+            print(f"释义向量索引与单词书不一致，忽略: {index_dir}")
+            return None
+        built_with = meta.get("backend_id", meta.get("backend", "torch"))
+        if backend and built_with != backend:
+            print(f"释义向量索引由 {built_with} 后端生成，与当前后端 {backend} 不一致，忽略: {index_dir}")
+            return None
+
+        matrix = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode='r')
+        offsets = np.load(os.path.join(index_dir, OFFSETS_FILE))
+        print(f"释义向量索引加载成功: 片段数 {matrix.shape[0]}")
+        return cls(matrix, offsets, meanings)
+
+    def lookup(self, correct_meaning: str) -> Optional[np.ndarray]:
+        """返回释义所有片段的向量 (片段数, 维度)，不在索引中返回 None"""
+        rows = self._rows.get(correct_meaning)
+        if rows is None or rows[0] == rows[1]:
+            return None
+        return self.matrix[rows[0]:rows[1]]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("用法: python embedding_index.py <单词书.json> <输出目录>")
+        sys.exit(1)
+
+    from text_similarity_bert import BertSimilarity
+
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        words = json.load(f)
+    build_index([w.get("chinese_meaning") for w in words], BertSimilarity(), sys.argv[2])
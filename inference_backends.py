@@ -0,0 +1,135 @@
+"""
+BertSimilarity 的推理后端
+
+- torch      : 原始 fp32 PyTorch 模型
+- torch_int8 : 对 Linear 层做动态 int8 量化的 PyTorch 模型
+- onnx       : ONNX Runtime 模型（fp32 或 model_export.py 量化后的 int8 模型）
+
+所有后端都返回 [CLS] 向量归一化后的 numpy float32 矩阵 (文本数, 维度)。
+"""
+import os
+from typing import List, Union
+
+import numpy as np
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'bert-base-chinese')
+DEFAULT_ONNX_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'bert-base-chinese-onnx', 'model.onnx')
+MAX_LENGTH = 512
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class InferenceBackend:
+    """推理后端接口"""
+
+    name = "base"
+
+    def __init__(self, model_dir: str = DEFAULT_MODEL_DIR):
+        from transformers import BertTokenizer
+
+        self.model_dir = model_dir
+        self.tokenizer = BertTokenizer.from_pretrained(model_dir, cache_dir=model_dir)
+
+    @property
+    def identity(self) -> str:
+        """区分生成向量的具体模型，用于判断离线索引和向量缓存是否可以复用"""
+        return self.name
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """编码文本，返回归一化后的 [CLS] 向量"""
+        raise NotImplementedError
+
+
+class TorchBackend(InferenceBackend):
+    """fp32 PyTorch 模型"""
+
+    name = "torch"
+
+    def __init__(self, model_dir: str = DEFAULT_MODEL_DIR):
+        super().__init__(model_dir)
+        import torch
+        from transformers import BertModel
+
+        self.torch = torch
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.model = self._load_model(BertModel.from_pretrained(model_dir, cache_dir=model_dir))
+        self.model.eval()
+
+    def _load_model(self, model):
+        return model.to(self.device)
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        inputs = self.tokenizer(texts, return_tensors='pt', padding=True, truncation=True, max_length=MAX_LENGTH)
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+
+        with self.torch.no_grad():
+            outputs = self.model(**inputs)
+            # 使用[CLS]标记的输出作为整个句子的表示
+            embeddings = outputs.last_hidden_state[:, 0, :]
+
+        return _normalize(embeddings.cpu().numpy())
+
+
+class QuantizedTorchBackend(TorchBackend):
+    """动态 int8 量化的 PyTorch 模型，只在 CPU 上运行"""
+
+    name = "torch_int8"
+
+    def _load_model(self, model):
+        self.device = self.torch.device('cpu')
+        return self.torch.quantization.quantize_dynamic(
+            model.to(self.device), {self.torch.nn.Linear}, dtype=self.torch.qint8
+        )
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime 模型，模型文件由 model_export.py 导出"""
+
+    name = "onnx"
+
+    def __init__(self, model_dir: str = DEFAULT_MODEL_DIR, onnx_model: str = DEFAULT_ONNX_MODEL,
+                 intra_op_threads: int = 0):
+        super().__init__(model_dir)
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("使用 onnx 后端需要安装 onnxruntime: pip install onnxruntime")
+
+        if not os.path.exists(onnx_model):
+            raise RuntimeError(f"ONNX 模型不存在，请先运行 python model_export.py export: {onnx_model}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(onnx_model, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.onnx_model = onnx_model
+
+    @property
+    def identity(self) -> str:
+        # fp32 和 int8 量化模型的文件名、大小不同，向量不能混用
+        return f"{self.name}:{os.path.basename(self.onnx_model)}:{os.path.getsize(self.onnx_model)}"
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        inputs = self.tokenizer(texts, return_tensors='np', padding=True, truncation=True, max_length=MAX_LENGTH)
+        feeds = {k: v.astype(np.int64) for k, v in inputs.items() if k in self.input_names}
+        last_hidden_state = self.session.run(["last_hidden_state"], feeds)[0]
+        return _normalize(last_hidden_state[:, 0, :])
+
+
+BACKENDS = {
+    TorchBackend.name: TorchBackend,
+    QuantizedTorchBackend.name: QuantizedTorchBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+def create_backend(name: str = "torch", model_dir: str = DEFAULT_MODEL_DIR, **options) -> InferenceBackend:
+    """按名称创建推理后端"""
+    if name not in BACKENDS:
+        raise ValueError(f"未知的推理后端: {name}，可选: {', '.join(BACKENDS)}")
+    return BACKENDS[name](model_dir, **options)
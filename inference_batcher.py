@@ -0,0 +1,100 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """
+    动态微批处理：把并发的编码请求攒成一批，padding 后一次前向计算
+
+    - 攒够 max_batch_size 条或等待超过 max_wait_ms 毫秒就发起一次计算
+    - 模型计算在单独的单线程线程池里执行，不阻塞事件循环，也不和其他请求抢 CPU 核
+    - 每个调用方拿到自己那一行的向量 (numpy float32)
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], object],
+                 max_batch_size: int = 32, max_wait_ms: float = 5):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bert-batch")
+
+        # 统计信息
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.total_wait = 0.0
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def encode(self, text: str) -> np.ndarray:
+        """编码单个文本，返回归一化后的向量"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, time.monotonic()))
+        return await future
+
+    async def encode_many(self, texts: Sequence[str]) -> np.ndarray:
+        """编码多个文本，返回 (len(texts), 维度) 的矩阵"""
+        vectors = await asyncio.gather(*(self.encode(text) for text in texts))
+        return np.stack(vectors)
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            texts = [text for text, _, _ in batch]
+            try:
+                embeddings = await loop.run_in_executor(self._executor, self.encode_fn, texts)
+                if hasattr(embeddings, "cpu"):
+                    embeddings = embeddings.cpu().numpy()
+                embeddings = np.asarray(embeddings, dtype=np.float32)
+            except Exception as e:
+                print(f"批量编码失败: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            now = time.monotonic()
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            for row, (_, future, enqueued_at) in enumerate(batch):
+                self.total_wait += now - enqueued_at
+                if not future.done():
+                    future.set_result(embeddings[row])
+
+    def stats(self) -> dict:
+        """队列深度和批大小统计"""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+            "largest_batch": self.largest_batch,
+            "avg_latency_ms": round(self.total_wait / self.items * 1000, 2) if self.items else 0,
+        }
@@ -0,0 +1,221 @@
+"""
+本地共享推理服务
+
+多 worker 部署时，每个 uvicorn worker 各自加载一份 bert-base-chinese 会成倍占用内存、
+互相抢占 CPU。本服务通过 Unix domain socket 对外提供编码接口，只持有一份模型，
+并把所有 web worker 的请求合并成批次计算。web worker 在配置 [bert] mode=remote 后
+只作为轻量客户端。
+
+协议: 每条消息都是 4 字节大端长度 + 内容
+    请求: JSON {"op": "encode", "texts": [...]} 或 {"op": "ping"}
+    响应: JSON 头 {"shape": [n, dim]} 后跟一条 float32 原始字节消息，
+          或 JSON {"ready": bool, "backend": str}，出错时为 {"error": str}
+
+启动:
+    python inference_server.py --socket /tmp/word_quiz_inference.sock --words toefl.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+from typing import Optional, Sequence
+
+import numpy as np
+
+from inference_batcher import EmbeddingBatcher
+
+DEFAULT_SOCKET_PATH = "/tmp/word_quiz_inference.sock"
+LENGTH = struct.Struct(">I")
+
+
+async def _read_message(reader: asyncio.StreamReader) -> bytes:
+    (length,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    return await reader.readexactly(length)
+
+
+def _write_message(writer: asyncio.StreamWriter, payload: bytes) -> None:
+    writer.write(LENGTH.pack(len(payload)) + payload)
+
+
+def _write_json(writer: asyncio.StreamWriter, data: dict) -> None:
+    _write_message(writer, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+class InferenceServer:
+    def __init__(self, socket_path: str, max_batch_size: int = 64, max_wait_ms: float = 5):
+        from text_similarity_bert import BertSimilarity
+
+        self.socket_path = socket_path
+        self.model = BertSimilarity()
+        self.batcher = EmbeddingBatcher(self.model.get_text_embeddings, max_batch_size, max_wait_ms)
+        self.ready = False
+        self.connections = 0
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    request = json.loads(await _read_message(reader))
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                if request.get("op") == "ping":
+                    _write_json(writer, {"ready": self.ready, "backend": self.model.backend.identity,
+                                         "stats": self.batcher.stats(), "connections": self.connections})
+                else:
+                    try:
+                        vectors = await self.batcher.encode_many(request["texts"])
+                        _write_json(writer, {"shape": list(vectors.shape)})
+                        _write_message(writer, vectors.astype(np.float32).tobytes())
+                    except Exception as e:
+                        _write_json(writer, {"error": str(e)})
+                await writer.drain()
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self, meanings: Sequence[Optional[str]]) -> None:
+        loop = asyncio.get_running_loop()
+        samples = await loop.run_in_executor(None, self.model.warm_up, meanings)
+        print(f"模型预热完成，预热样本数: {samples}")
+        self.ready = True
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        print(f"推理服务已启动: {self.socket_path}")
+        async with server:
+            await server.serve_forever()
+
+
+class InferenceClient:
+    """
+    推理服务客户端，接口与 EmbeddingBatcher 一致 (encode / encode_many / stats)
+    保持少量长连接复用，连接出错时丢弃重连；
+    复用的连接可能已失效（例如推理服务重启过），收发失败时换新连接重试一次
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, pool_size: int = 4):
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self._idle: list = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+
+    async def _acquire(self, fresh: bool = False):
+        """返回 (连接, 是否为复用的连接)，fresh 为 True 时不使用空闲连接"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.pool_size)
+        await self._semaphore.acquire()
+        if self._idle and not fresh:
+            return self._idle.pop(), True
+        try:
+            return await asyncio.open_unix_connection(self.socket_path), False
+        except Exception:
+            self._semaphore.release()
+            raise
+
+    def _release(self, connection, healthy: bool) -> None:
+        if healthy:
+            self._idle.append(connection)
+        else:
+            connection[1].close()
+        self._semaphore.release()
+
+    async def encode_many(self, texts: Sequence[str]) -> np.ndarray:
+        """编码多个文本，返回 (len(texts), 维度) 的矩阵"""
+        self.requests += 1
+        try:
+            connection, reused = await self._acquire()
+            try:
+                return await self._request(connection, texts)
+            except (OSError, EOFError):
+                if not reused:
+                    raise
+            self.retries += 1
+            connection, _ = await self._acquire(fresh=True)
+            return await self._request(connection, texts)
+        except Exception:
+            self.errors += 1
+            raise
+
+    async def _request(self, connection, texts: Sequence[str]) -> np.ndarray:
+        reader, writer = connection
+        healthy = False
+        try:
+            _write_json(writer, {"op": "encode", "texts": list(texts)})
+            await writer.drain()
+            header = json.loads(await _read_message(reader))
+            if "error" in header:
+                healthy = True
+                raise RuntimeError(f"推理服务编码失败: {header['error']}")
+            data = await _read_message(reader)
+            healthy = True
+            return np.frombuffer(data, dtype=np.float32).reshape(header["shape"])
+        finally:
+            self._release(connection, healthy)
+
+    async def encode(self, text: str) -> np.ndarray:
+        """编码单个文本，返回归一化后的向量"""
+        return (await self.encode_many([text]))[0]
+
+    def ping(self, timeout: float = 2) -> dict:
+        """同步检查推理服务状态，服务不可用时返回 {"ready": False}"""
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout)
+                sock.connect(self.socket_path)
+                payload = json.dumps({"op": "ping"}).encode("utf-8")
+                sock.sendall(LENGTH.pack(len(payload)) + payload)
+                (length,) = LENGTH.unpack(self._recv_exactly(sock, LENGTH.size))
+                return json.loads(self._recv_exactly(sock, length))
+        except (OSError, ValueError) as e:
+            return {"ready": False, "error": str(e)}
+
+    @staticmethod
+    def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("推理服务连接已关闭")
+            data += chunk
+        return data
+
+    def stats(self) -> dict:
+        return {
+            "mode": "remote",
+            "socket_path": self.socket_path,
+            "idle_connections": len(self._idle),
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+        }
+
+
+def main():
+    from util import load_config
+
+    bert_config = load_config("bert", required=False)
+    parser = argparse.ArgumentParser(description="共享 BERT 推理服务")
+    parser.add_argument("--socket", default=bert_config.get("socket_path", DEFAULT_SOCKET_PATH))
+    parser.add_argument("--words", default="toefl.json", help="用于预热的单词书")
+    parser.add_argument("--batch-size", type=int, default=int(bert_config.get("batch_max_size", 32)))
+    parser.add_argument("--wait-ms", type=float, default=float(bert_config.get("batch_max_wait_ms", 5)))
+    args = parser.parse_args()
+
+    with open(args.words, 'r', encoding='utf-8') as f:
+        meanings = [w.get("chinese_meaning") for w in json.load(f)]
+
+    server = InferenceServer(args.socket, args.batch_size, args.wait_ms)
+    asyncio.run(server.serve(meanings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+词面快速判分
+
+在调用 BERT 和 OpenAI 之前先做廉价的词面比较，答案和某个释义片段
+完全一致、互相包含或按顺序的相似度（最长公共子序列）很高时直接给出分数，其余答案交给模型判分。
+只比较字符集合会把 故事/事故、蜂蜜/蜜蜂 这类字序不同的词判为正确，因此相似度必须考虑字序。
+"""
+import unicodedata
+from difflib import SequenceMatcher
+from typing import List, Optional
+
+from util import split_meanings
+
+# 比较时忽略的虚词
+FILLER_CHARS = set("的地")
+# 释义中的注释括号，例如 【语】、（指飞行器或汽车）
+BRACKETS = {"（": "）", "(": ")", "【": "】", "[": "]"}
+# 否定词，一方带否定一方不带时词面相似并不代表意思相近
+NEGATION_CHARS = set("不非无未没勿")
+
+
+def _strip_brackets(text: str) -> str:
+    result = []
+    closing = None
+    for ch in text:
+        if closing:
+            if ch == closing:
+                closing = None
+            continue
+        if ch in BRACKETS:
+            closing = BRACKETS[ch]
+            continue
+        result.append(ch)
+    return "".join(result)
+
+
+def normalize(text: str) -> str:
+    """去掉括号注释、空白、标点和 的/地"""
+    if not text:
+        return ""
+    return "".join(
+        ch for ch in _strip_brackets(text)
+        if not ch.isspace()
+        and not unicodedata.category(ch).startswith("P")
+        and ch not in FILLER_CHARS
+    )
+
+
+def _overlap(a: str, b: str) -> float:
+    """考虑字序的相似度：2 * 匹配的公共子序列长度 / 总长度，字序颠倒的词得分很低"""
+    return SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def _negation_mismatch(a: str, b: str) -> bool:
+    return bool(NEGATION_CHARS & set(a)) != bool(NEGATION_CHARS & set(b))
+
+
+class LexicalGrader:
+    EXACT_SCORE = 100.0
+    CONTAINS_SCORE = 95.0
+
+    def __init__(self, overlap_threshold: float = 0.8, contains_ratio: float = 0.6):
+        self.overlap_threshold = overlap_threshold
+        self.contains_ratio = contains_ratio
+
+        self.checked = 0
+        self.exact = 0
+        self.contains = 0
+        self.overlap = 0
+
+    def _segments(self, correct_meaning: str) -> List[str]:
+        segments = [normalize(m) for m in split_meanings(correct_meaning)]
+        return [s for s in segments if s]
+
+    def grade(self, answer: str, correct_meaning: str) -> Optional[float]:
+        """
+        词面判分
+
+        Returns:
+            有把握时返回最终分数（0-100），否则返回 None 交给模型判分
+        """
+        self.checked += 1
+        normalized = normalize(answer)
+        if not normalized:
+            return None
+        segments = self._segments(correct_meaning)
+
+        if normalized in segments:
+            self.exact += 1
+            return self.EXACT_SCORE
+
+        best_overlap = 0.0
+        for segment in segments:
+            if _negation_mismatch(normalized, segment):
+                continue
+            shorter, longer = sorted((normalized, segment), key=len)
+            if len(shorter) >= 2 and shorter in longer and len(shorter) / len(longer) >= self.contains_ratio:
+                self.contains += 1
+                return self.CONTAINS_SCORE
+            best_overlap = max(best_overlap, _overlap(normalized, segment))
+
+        # 必须严格高于阈值，恰好等于阈值时交给模型判分
+        if best_overlap > self.overlap_threshold:
+            self.overlap += 1
+            return round(best_overlap * 100, 2)
+        return None
+
+    def stats(self) -> dict:
+        """快速判分命中统计"""
+        resolved = self.exact + self.contains + self.overlap
+        return {
+            "checked": self.checked,
+            "resolved": resolved,
+            "exact": self.exact,
+            "contains": self.contains,
+            "overlap": self.overlap,
+            "resolved_ratio": round(resolved / self.checked, 4) if self.checked else 0,
+        }
@@ -3,20 +3,27 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.routing import APIRouter
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, JSONResponse, Response
 from pydantic import BaseModel
 import json
+from urllib.parse import quote
 from difflib import SequenceMatcher
-from typing import Optional
-from store import UserStore, init_db
-from speech import text_to_speech
+from typing import Optional, List
+from store import init_db, check_database, encode_wrong_list_cursor
+from async_store import AsyncUserStore, close_async_db, user_state_cache, password_hasher, auth_config
+from auth import PasswordHasherBusy, VerifiedTokenCache
+from speech import async_tts
+from audio_store import AudioStore
+from audio_prefetch import AudioPrefetcher
 import jwt as pyjwt
 from datetime import datetime, timedelta
 import os
 from fastapi.responses import FileResponse
-from check_answer import check_answer_by_all_means
+from check_answer import check_answer_by_all_means, GradingUnavailable, start_model_loading, open_score_cache, close_clients, is_model_ready, model_status, meaning_index_loaded, score_cache_available, get_grading_metrics
 import math
 from util import load_config
+from vocabulary import VocabularyCatalog
+from progress_buffer import ProgressBuffer
 
 # 创建API路由器
 api_router = APIRouter(prefix="/api")
@@ -65,22 +72,82 @@ SECRET_KEY = jwt_config["secret_key"]
 ALGORITHM = jwt_config["algorithm"]
 ACCESS_TOKEN_EXPIRE_MINUTES = int(jwt_config["access_token_expire_minutes"])
 
-# 加载单词数据
-with open('toefl.json', 'r', encoding='utf-8') as f:
-    word_list = json.load(f)
+# 已验证令牌缓存，令牌过期前的重复请求不再验签
+token_cache = VerifiedTokenCache(int(auth_config.get("token_cache_size", 10000)))
 
-# 加载章节数据
-with open('chapter.json', 'r', encoding='utf-8') as f:
-    chapter_list = json.load(f)
-
-def get_word_index(word: str):
-    # 返回word在word_list中的索引, word_list的格式是[{word: str, phonetic: str, part_of_speech: str, chinese_meaning: str}]
-    return next((i for i, w in enumerate(word_list) if w["word"] == word), None)
+# 单词音频存储，缺失时调用讯飞语音合成生成
+audio_config = load_config("audio", required=False)
+audio_store = AudioStore(
+    lambda text: async_tts().synthesize(text),
+    root=audio_config.get("dir", "speech"),
+    max_bytes=int(audio_config.get("max_mb", 512)) * 1024 * 1024
+)
 
-# 遍历chapter_list，找到start_word和end_word，在word_list中的索引，作为start_index和end_index
-for chapter in chapter_list:
-    chapter["start_index"] = get_word_index(chapter["start_word"])
-    chapter["end_index"] = get_word_index(chapter["end_word"])
+# 加载单词书目录（单词数据 + 章节数据），所有查找都走目录索引
+catalog = VocabularyCatalog.load('toefl.json', 'chapter.json', 'toefl.bin')
+
+# 单词音频后台预取：切换章节或接近已预取范围末尾时，提前合成接下来的单词
+audio_prefetcher = AudioPrefetcher(
+    audio_store,
+    words=[catalog[i]["word"] for i in range(len(catalog))],
+    concurrency=int(audio_config.get("prefetch_concurrency", 1)),
+    window=int(audio_config.get("prefetch_window", 20)),
+    low_watermark=int(audio_config.get("prefetch_low_watermark", 5))
+) if audio_config.get("prefetch_enabled", "true").lower() == "true" else None
+
+@app.on_event("startup")
+def start_password_hasher():
+    """创建密码哈希进程池，必须在后台加载模型之前"""
+    password_hasher.start()
+
+@app.on_event("startup")
+def load_grading_model():
+    """后台加载并预热判分模型，应用启动不等待模型"""
+    start_model_loading([catalog[i].get("chinese_meaning") for i in range(len(catalog))])
+
+# 学习进度写缓冲，开启后进度先记在内存中，定时批量写回数据库
+progress_config = load_config("progress", required=False)
+progress_buffer = ProgressBuffer(
+    AsyncUserStore.update_word_indexes,
+    flush_interval=float(progress_config.get("flush_interval_seconds", 2)),
+    max_pending=int(progress_config.get("max_pending", 1000))
+) if progress_config.get("write_behind", "false").lower() == "true" else None
+
+@app.on_event("startup")
+async def open_caches():
+    """打开相似度分数缓存数据库"""
+    await open_score_cache()
+
+@app.on_event("startup")
+async def start_progress_buffer():
+    """启动进度定时写回"""
+    if progress_buffer:
+        progress_buffer.start()
+
+@app.on_event("shutdown")
+async def close_grading_clients():
+    """写回缓冲的进度，关闭判分使用的连接池和数据库连接池，保存答案向量缓存"""
+    if progress_buffer:
+        await progress_buffer.stop()
+    if audio_prefetcher:
+        await audio_prefetcher.stop()
+    await close_clients()
+    await close_async_db()
+
+async def get_word_index(username: str) -> Optional[int]:
+    """获取用户当前单词索引，优先读取写缓冲中尚未写回的进度"""
+    if progress_buffer:
+        index = progress_buffer.get(username)
+        if index is not None:
+            return index
+    return await AsyncUserStore.get_word_index(username)
+
+async def update_word_index(username: str, index: int) -> bool:
+    """更新用户当前单词索引，开启写缓冲时延迟批量写回"""
+    if progress_buffer:
+        progress_buffer.set(username, index)
+        return True
+    return await AsyncUserStore.update_word_index(username, index)
 
 class UserCreate(BaseModel):
     username: str
@@ -92,6 +159,13 @@ class UserAnswer(BaseModel):
 class Progress(BaseModel):
     index: int
 
+class WrongWordIncrement(BaseModel):
+    word: str
+    count: int = 1
+
+class WrongWordBatch(BaseModel):
+    items: List[WrongWordIncrement]
+
 class WordResponse(BaseModel):
     word: str
     phonetic: Optional[str]
@@ -100,11 +174,16 @@ class WordResponse(BaseModel):
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """验证用户token并返回用户名"""
+    username = token_cache.get(token)
+    if username is not None:
+        return username
     try:
         payload = pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="无效的认证信息")
+        if "exp" in payload:
+            token_cache.put(token, username, float(payload["exp"]))
         return username
     except pyjwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token已过期，请重新登录")
@@ -121,9 +200,12 @@ def create_access_token(data: dict):
 
 # 将所有API路由添加到路由器
 @api_router.post("/register")
-def register_user(user: UserCreate):
+async def register_user(user: UserCreate):
     """注册新用户"""
-    result = UserStore.create_user(user.username, user.password)
+    try:
+        result = await AsyncUserStore.create_user(user.username, user.password)
+    except PasswordHasherBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     if not result:
         raise HTTPException(status_code=400, detail="用户名已存在")
     return {"message": "注册成功"}
@@ -131,7 +213,10 @@ def register_user(user: UserCreate):
 @api_router.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """用户登录"""
-    user = UserStore.verify_user(form_data.username, form_data.password)
+    try:
+        user = await AsyncUserStore.verify_user(form_data.username, form_data.password)
+    except PasswordHasherBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     if not user:
         raise HTTPException(status_code=401, detail="用户名或密码错误")
     
@@ -141,11 +226,11 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 @api_router.get("/current-word")
 async def get_current_word(username: str = Depends(get_current_user)):
     """获取当前单词"""
-    current_word_index = UserStore.get_word_index(username)
-    if current_word_index >= len(word_list):
+    current_word_index = await get_word_index(username)
+    if current_word_index >= len(catalog):
         raise HTTPException(status_code=404, detail="已完成所有单词学习")
     
-    word_data = word_list[current_word_index]
+    word_data = catalog[current_word_index]
     return WordResponse(
         word=word_data["word"],
         phonetic=word_data.get("phonetic"),
@@ -158,18 +243,21 @@ async def check_answer(
     username: str = Depends(get_current_user)
 ):
     """检查用户答案"""
-    current_word_index = UserStore.get_word_index(username)
+    current_word_index = await get_word_index(username)
     if current_word_index is None:
         raise HTTPException(status_code=404, detail="用户不存在")
     
-    if current_word_index >= len(word_list):
+    if current_word_index >= len(catalog):
         raise HTTPException(status_code=404, detail="已完成所有单词学习")
     
-    current_word = word_list[current_word_index]["word"]
-    correct_meaning = word_list[current_word_index]["chinese_meaning"]
-    score = await check_answer_by_all_means(user_answer.answer, correct_meaning)
+    current_word = catalog[current_word_index]["word"]
+    correct_meaning = catalog[current_word_index]["chinese_meaning"]
+    try:
+        score = await check_answer_by_all_means(user_answer.answer, correct_meaning)
+    except GradingUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     passed = score >= 80
-    wrong_count = UserStore.get_word_error_count(username, current_word)
+    wrong_count = await AsyncUserStore.get_word_error_count(username, current_word)
     response = {
         "similarity": score,
         "passed": passed,
@@ -182,14 +270,16 @@ async def check_answer(
 @api_router.post("/next-word")
 async def next_word(username: str = Depends(get_current_user)):
     """移动到下一个单词"""
-    current_word_index = UserStore.get_word_index(username)
+    current_word_index = await get_word_index(username)
     new_index = current_word_index + 1
     
-    if new_index >= len(word_list):
+    if new_index >= len(catalog):
         raise HTTPException(status_code=404, detail="已完成所有单词学习")
     
-    UserStore.update_word_index(username, new_index)
-    word_data = word_list[new_index]
+    await update_word_index(username, new_index)
+    if audio_prefetcher:
+        audio_prefetcher.maybe_prefetch(username, new_index)
+    word_data = catalog[new_index]
     current_word_index = new_index
     return WordResponse(
         word=word_data["word"],
@@ -198,21 +288,19 @@ async def next_word(username: str = Depends(get_current_user)):
     )
 
 @api_router.get("/progress")
-def get_progress(username: str = Depends(get_current_user)):
+async def get_progress(username: str = Depends(get_current_user)):
     """获取学习进度"""
-    current_word_index = UserStore.get_word_index(username)
+    current_word_index = await get_word_index(username)
     
     # 获取当前章节信息
     current_chapter = None
-    chapter_index = None
-    for idx, chapter in enumerate(chapter_list):
-        if chapter["start_index"] <= current_word_index < chapter["end_index"]:
-            current_chapter = chapter
-            chapter_index = idx
-            break
+    chapter_index = catalog.chapter_of(current_word_index)
+    if chapter_index is not None:
+        current_chapter = catalog.chapters[chapter_index]
     
     # 如果找到当前章节，计算章节内进度
     chapter_progress = None
+    chapter_current = None
     if current_chapter:
         chapter_total = current_chapter["end_index"] - current_chapter["start_index"]
         chapter_current = current_word_index - current_chapter["start_index"] + 1
@@ -222,51 +310,85 @@ def get_progress(username: str = Depends(get_current_user)):
         "current_index": current_word_index,
         "chapter_current": chapter_current,
         "current_chapter_index": chapter_index,
-        "total_words": len(word_list),
-        "progress_percentage": round((current_word_index / len(word_list)) * 100, 2),
+        "total_words": len(catalog),
+        "progress_percentage": round((current_word_index / len(catalog)) * 100, 2),
         "current_chapter_progress": chapter_progress,
         "current_chapter_total_words": (current_chapter["end_index"] - current_chapter["start_index"]) if current_chapter else None
     }
 
 # 切换章节
 @api_router.post("/switch-chapter")
-def switch_chapter(progress: Progress,
+async def switch_chapter(progress: Progress,
                    username: str = Depends(get_current_user)):
     """切换章节"""
-    # 根据chapter_index从chapter_list中获取start_word, 然后更新UserStore中的current_word_index
-    start_word = chapter_list[progress.index]["start_word"]
-    # 查找 start_word 在 word_list 中的索引
-    start_index = next(
-        (i for i, word in enumerate(word_list) if word["word"] == start_word),
-        None
-    )
+    # 根据chapter_index从章节列表中获取start_word, 然后更新UserStore中的current_word_index
+    start_word = catalog.chapters[progress.index]["start_word"]
+    start_index = catalog.index_of(start_word)
     
     if start_index is None:
         raise HTTPException(status_code=404, detail=f"找不到单词 {start_word}")
         
     print(f"start_word: {start_word}, index: {start_index}")
-    UserStore.update_word_index(username, start_index)
+    await update_word_index(username, start_index)
+    if audio_prefetcher:
+        audio_prefetcher.prefetch_range(username, start_index)
 
 
 @api_router.post("/reset")
-def reset_progress(username: str = Depends(get_current_user)):
+async def reset_progress(username: str = Depends(get_current_user)):
     """重置学习进度"""
-    UserStore.update_word_index(username, 0)
+    await update_word_index(username, 0)
+    if audio_prefetcher:
+        audio_prefetcher.prefetch_range(username, 0)
     return {"message": "进度已重置"}
 
+@api_router.get("/health/live")
+def health_live():
+    """存活检查：进程能响应请求即可"""
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+def health_ready():
+    """就绪检查：模型已预热、数据库可用时才接收流量"""
+    checks = {
+        "model": is_model_ready(),
+        "database": check_database(),
+        "cache": {
+            "vocabulary": len(catalog) > 0,
+            "meaning_index": meaning_index_loaded(),
+            "score_cache": score_cache_available(),
+        },
+    }
+    ready = checks["model"] and checks["database"]
+    body = {"status": "ready" if ready else "not_ready", "checks": checks}
+    if model_status["error"]:
+        body["error"] = model_status["error"]
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+@api_router.get("/metrics")
+def get_metrics():
+    """获取运行指标"""
+    return {
+        "grading": get_grading_metrics(),
+        "progress_buffer": progress_buffer.stats() if progress_buffer else None,
+        "user_cache": user_state_cache.stats() if user_state_cache else None,
+        "password_hasher": password_hasher.stats(),
+        "token_cache": token_cache.stats(),
+        "tts": async_tts().stats(),
+        "audio_store": audio_store.stats(),
+        "audio_prefetch": audio_prefetcher.stats() if audio_prefetcher else None
+    }
+
 @api_router.get("/word-audio/{word}")
 async def get_word_audio(word: str):
     """获取单词的音频文件"""
     try:
-        audio_path = text_to_speech(word)
-        # 打印audio_path
-        print(f"audio_path: {audio_path}")
-
-        # 返回音频文件
-        return FileResponse(
-            audio_path,
+        # 直接返回音频数据：文件可能在开始发送前被其他 worker 淘汰
+        audio = await audio_store.read(word)
+        return Response(
+            audio,
             media_type="audio/mp3",
-            filename=f"{word}.mp3"
+            headers={"Content-Disposition": f"attachment; filename*=utf-8''{quote(word + '.mp3')}"}
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -281,38 +403,61 @@ async def add_to_wrong_list(request: dict,
     
     try:
         # 这里添加将单词加入错词本的逻辑
-        UserStore.add_to_wrong_list(username, word)
-        return {"message": "Successfully added to wrong list"}
+        error_count = await AsyncUserStore.add_to_wrong_list(username, word)
+        return {"message": "Successfully added to wrong list", "error_count": error_count}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/add-to-wrong-list/batch")
+async def add_to_wrong_list_batch(request: WrongWordBatch,
+      username: str = Depends(get_current_user)):
+    """批量加入错词本，用于离线答题后一次性提交"""
+    try:
+        count = await AsyncUserStore.add_to_wrong_list_batch(
+            (username, item.word, item.count) for item in request.items
+        )
+        return {"message": "Successfully added to wrong list", "words": count}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/get-wrong-list")
-def get_wrong_list(
+async def get_wrong_list(
     page: int = Query(default=1, ge=1),
     per_page: int = Query(default=5, ge=1),
+    cursor: Optional[str] = Query(default=None),
     username: str = Depends(get_current_user)
 ):
-    """获取用户的错词列表"""
-    wrong_words = UserStore.get_wrong_list(username, page, per_page)
+    """
+    获取用户的错词列表
+
+    默认按 page 页码分页；传入 cursor 时使用游标分页（第一页传空字符串），
+    之后每次传入上一页返回的 next_cursor，翻到多深都只扫描一页的数据
+    """
+    try:
+        wrong_words = await AsyncUserStore.get_wrong_list(username, page, per_page, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     # wrong_words 是格式为[{"word": "word", "error_count": 1}]的一个list
-    # 根据wrong_words中的word，从word_list中获取对应的chinese_meaning
+    # 根据wrong_words中的word，从单词书目录中获取对应的chinese_meaning
+    next_cursor = encode_wrong_list_cursor(wrong_words[-1]) if len(wrong_words) == per_page else None
     for word in wrong_words:
-        word_info = next((w for w in word_list if w["word"] == word["word"]), None)
-        if word_info:
-            word["meaning"] = word_info["chinese_meaning"]
-    total_count = UserStore.get_wrong_words_count(username)
+        meaning = catalog.meaning_of(word["word"])
+        if meaning is not None:
+            word["meaning"] = meaning
+    total_count = await AsyncUserStore.get_wrong_words_count(username)
     total_pages = math.ceil(total_count / per_page)
     return {
         "words": wrong_words,
         "total_pages": total_pages,
-        "current_page": page,
-        "total_words": total_count
+        "current_page": page if cursor is None else None,
+        "total_words": total_count,
+        "next_cursor": next_cursor
     }
 
 @app.post("/api/next-word")
 async def next_word(username: str = Depends(get_current_user)):
     """获取下一个单词"""
-    current_word_index = UserStore.get_word_index(username)
+    current_word_index = await get_word_index(username)
     
     # 如果是新用户，初始化索引为0
     if current_word_index is None:
@@ -321,15 +466,17 @@ async def next_word(username: str = Depends(get_current_user)):
     else:
         new_index = current_word_index + 1
         # 检查是否超出单词列表范围
-        if new_index >= len(word_list):
+        if new_index >= len(catalog):
             raise HTTPException(status_code=404, detail="已完成所有单词学习")
         
-        UserStore.update_word_index(username, new_index)
+        await update_word_index(username, new_index)
+        if audio_prefetcher:
+            audio_prefetcher.maybe_prefetch(username, new_index)
         current_word_index = new_index
     
     return {
-        "word": word_list[current_word_index]["word"],
-        "phonetic": word_list[current_word_index].get("phonetic", "")
+        "word": catalog[current_word_index]["word"],
+        "phonetic": catalog[current_word_index].get("phonetic", "")
     }
 
 # 将API路由器注册到应用
@@ -4,11 +4,43 @@ import configparser
 import logging
 import tempfile
 import shutil
+import sys
+import argparse
+import xml.etree.ElementTree as ET
+from typing import Set, Tuple, List
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from util import load_config
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+LIQUIBASE_NS = "{http://www.liquibase.org/xml/ns/dbchangelog}"
+# 多个进程同时启动时只允许一个进程执行迁移
+MIGRATION_LOCK_NAME = "word_quiz_migrations"
+
+def changelog_changesets(changelog_path: str) -> List[Tuple[str, str]]:
+    """
+    解析 changelog 中的所有 changeSet (id, author)，递归处理 <include>
+
+    runAlways / runOnChange 的 changeSet 无法只凭 id 判断是否需要执行，
+    返回的 id 带上 "*" 前缀，使其总被当作待执行
+    """
+    changesets = []
+    root = ET.parse(changelog_path).getroot()
+    for element in root:
+        if element.tag == LIQUIBASE_NS + "include":
+            include_path = element.get("file")
+            if element.get("relativeToChangelogFile", "false").lower() == "true":
+                include_path = os.path.join(os.path.dirname(changelog_path), include_path)
+            changesets.extend(changelog_changesets(include_path))
+        elif element.tag == LIQUIBASE_NS + "changeSet":
+            changeset_id = element.get("id")
+            if "true" in (element.get("runAlways", "false").lower(), element.get("runOnChange", "false").lower()):
+                changeset_id = "*" + changeset_id
+            changesets.append((changeset_id, element.get("author")))
+    return changesets
+
 class LiquibaseMigrator:
     def __init__(self):
         self.config = self._load_config()
@@ -20,6 +52,60 @@ class LiquibaseMigrator:
         """从 application.properties 加载配置"""
         return load_config('database')
 
+    def _changelog_file(self) -> str:
+        return load_config('migrations', required=False).get('changeLogFile', 'migrations/changelog.xml')
+
+    @staticmethod
+    def applied_changesets(conn) -> Set[Tuple[str, str]]:
+        """DATABASECHANGELOG 中已执行的 changeSet，表不存在时返回空集合"""
+        exists = conn.execute(text(
+            "SELECT COUNT(*) FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = 'DATABASECHANGELOG'"
+        )).scalar()
+        if not exists:
+            return set()
+        return {(row[0], row[1]) for row in conn.execute(text("SELECT ID, AUTHOR FROM DATABASECHANGELOG"))}
+
+    def pending_changesets(self, conn) -> List[Tuple[str, str]]:
+        """changelog 中尚未执行的 changeSet"""
+        changelog_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), self._changelog_file())
+        applied = self.applied_changesets(conn)
+        return [changeset for changeset in changelog_changesets(changelog_path) if changeset not in applied]
+
+    def migrate_if_needed(self, lock_timeout: int = 300, force: bool = False) -> bool:
+        """
+        先用 Python 对比 DATABASECHANGELOG 和 changelog，没有待执行的 changeSet 时不启动 JVM
+
+        持有 MySQL 咨询锁 (GET_LOCK) 期间再检查一次并执行迁移，多个 worker 同时启动时
+        只有一个进程执行迁移，其他进程等待后发现已无待执行项直接返回
+
+        Returns:
+            bool: 是否执行了 Liquibase
+        """
+        from store import engine
+
+        with engine.connect() as conn:
+            if not force and not self.pending_changesets(conn):
+                logger.info("数据库已是最新，跳过迁移")
+                return False
+
+            locked = conn.execute(text("SELECT GET_LOCK(:name, :timeout)"),
+                                  {"name": MIGRATION_LOCK_NAME, "timeout": lock_timeout}).scalar()
+            if locked != 1:
+                raise Exception(f"等待迁移锁超时（{lock_timeout} 秒）")
+            try:
+                # 结束之前的读事务，避免在旧快照上检查
+                conn.rollback()
+                pending = self.pending_changesets(conn)
+                if not force and not pending:
+                    logger.info("其他进程已完成迁移，跳过迁移")
+                    return False
+                logger.info(f"待执行的 changeSet: {pending}")
+                self.run_migration()
+                return True
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK_NAME})
+
     def _create_temp_properties(self):
         """创建临时的 liquibase.properties 文件"""
         tmp_dir = os.path.join(os.path.dirname(__file__), 'tmp')
@@ -28,7 +114,7 @@ class LiquibaseMigrator:
         temp_file_path = os.path.join(tmp_dir, 'liquibase.properties')
         
         content = f"""
-changeLogFile=migrations/changelog.xml
+changeLogFile={self._changelog_file()}
 url={self.config['url']}
 username={self.config['username']}
 password={self.config['password']}
@@ -91,6 +177,25 @@ liquibase.hub.mode=off
                 os.remove(temp_properties)
                 logger.debug(f"临时配置文件已删除: {temp_properties}")
 
-def run_migrations():
+def run_migrations(force: bool = False) -> bool:
     migrator = LiquibaseMigrator()
-    migrator.run_migration()
\ No newline at end of file
+    return migrator.migrate_if_needed(force=force)
+
+def main():
+    parser = argparse.ArgumentParser(description="执行数据库迁移（部署时作为一次性命令运行）")
+    parser.add_argument("--check", action="store_true", help="只列出待执行的 changeSet，有待执行项时退出码为 1")
+    parser.add_argument("--force", action="store_true", help="跳过预检查，总是执行 Liquibase")
+    args = parser.parse_args()
+
+    if args.check:
+        from store import engine
+
+        with engine.connect() as conn:
+            pending = LiquibaseMigrator().pending_changesets(conn)
+        for changeset_id, author in pending:
+            print(f"待执行: {changeset_id} ({author})")
+        sys.exit(1 if pending else 0)
+    run_migrations(force=args.force)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""
+模型导出、量化和一致性检查
+
+用法:
+    # 导出 fp32 ONNX 模型
+    python model_export.py export --output models/bert-base-chinese-onnx/model.onnx
+
+    # 对 ONNX 模型做动态 int8 量化
+    python model_export.py quantize --input models/bert-base-chinese-onnx/model.onnx \\
+        --output models/bert-base-chinese-onnx/model.int8.onnx
+
+    # 用 toefl.json 的释义对比候选后端和 fp32 基线的打分，并统计编码延迟
+    python model_export.py parity --backend onnx --onnx-model models/bert-base-chinese-onnx/model.int8.onnx
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from inference_backends import DEFAULT_MODEL_DIR, DEFAULT_ONNX_MODEL, create_backend
+from util import split_meanings
+
+
+def export_onnx(model_dir: str, output: str, opset: int = 14) -> None:
+    """把 PyTorch 模型导出成 ONNX，batch 和序列长度都是动态维度"""
+    import torch
+    from transformers import BertModel, BertTokenizer
+
+    tokenizer = BertTokenizer.from_pretrained(model_dir, cache_dir=model_dir)
+    model = BertModel.from_pretrained(model_dir, cache_dir=model_dir)
+    model.eval()
+
+    sample = tokenizer(["放弃", "反常的"], return_tensors='pt', padding=True)
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            output,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    print(f"ONNX 模型已导出: {output}")
+
+
+def quantize_onnx(input_path: str, output: str) -> None:
+    """对 ONNX 模型做动态 int8 权重量化"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(input_path, output, weight_type=QuantType.QInt8)
+    print(f"int8 量化模型已生成: {output}, 大小: {os.path.getsize(output) / 1024 / 1024:.1f} MB")
+
+
+def _encode_all(backend, texts, batch_size):
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.append(backend.encode(texts[start:start + batch_size]))
+    return np.concatenate(vectors, axis=0)
+
+
+def _single_latency(backend, texts, rounds):
+    """逐条编码测延迟（模拟线上 batch=1 的最坏情况），返回毫秒列表"""
+    latencies = []
+    for text in texts[:rounds]:
+        start = time.perf_counter()
+        backend.encode([text])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def parity(word_path: str, backend_name: str, model_dir: str, limit: int, batch_size: int,
+           threshold: float, **options) -> bool:
+    """
+    用单词书释义对比候选后端和 fp32 基线
+
+    只使用至少有两个释义片段的单词：留出第一个片段作为答案（正例），其余片段作为标准释义，
+    正例答案不在标准释义中，不会因为和自身比较而恒为 100 分；负例答案取下一个单词留出的片段。
+    和 check_similarity 一样取各片段相似度最大值。
+    """
+    with open(word_path, 'r', encoding='utf-8') as f:
+        words = json.load(f)
+    meanings = [split_meanings(w.get("chinese_meaning")) for w in words]
+    meanings = [m for m in meanings if len(m) >= 2][:limit]
+
+    segments = []
+    offsets = [0]
+    for m in meanings:
+        segments.extend(m)
+        offsets.append(len(segments))
+
+    scores = {}
+    latencies = {}
+    for name, backend_options in (("torch", {}), (backend_name, options)):
+        backend = create_backend(name, model_dir, **backend_options)
+        vectors = _encode_all(backend, segments, batch_size)
+        result = []
+        for i in range(len(meanings)):
+            rows = vectors[offsets[i] + 1:offsets[i + 1]]
+            positive = vectors[offsets[i]]
+            negative = vectors[offsets[(i + 1) % len(meanings)]]
+            result.append(float((rows @ positive).max()) * 100)
+            result.append(float((rows @ negative).max()) * 100)
+        scores[name] = np.asarray(result)
+        latencies[name] = _single_latency(backend, segments, 200)
+
+    baseline, candidate = scores["torch"], scores[backend_name]
+    diff = np.abs(baseline - candidate)
+    agreement = float(np.mean((baseline >= threshold) == (candidate >= threshold)))
+    print(f"对比样本数: {len(baseline)}")
+    print(f"分数差  平均: {diff.mean():.3f}  p99: {np.percentile(diff, 99):.3f}  最大: {diff.max():.3f}")
+    print(f"以 {threshold} 分为界的判定一致率: {agreement * 100:.2f}%")
+    for name, values in latencies.items():
+        print(f"{name} 单条编码延迟 p50: {np.percentile(values, 50):.1f} ms  p99: {np.percentile(values, 99):.1f} ms")
+    return agreement >= 0.99
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BERT 模型导出、量化和一致性检查")
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR, help="PyTorch 模型目录")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = sub.add_parser("export", help="导出 ONNX 模型")
+    export_parser.add_argument("--output", default=DEFAULT_ONNX_MODEL)
+    export_parser.add_argument("--opset", type=int, default=14)
+
+    quantize_parser = sub.add_parser("quantize", help="对 ONNX 模型做 int8 量化")
+    quantize_parser.add_argument("--input", default=DEFAULT_ONNX_MODEL)
+    quantize_parser.add_argument("--output", required=True)
+
+    parity_parser = sub.add_parser("parity", help="和 fp32 基线对比打分")
+    parity_parser.add_argument("--backend", default="onnx", choices=["torch_int8", "onnx"])
+    parity_parser.add_argument("--onnx-model", default=DEFAULT_ONNX_MODEL)
+    parity_parser.add_argument("--words", default="toefl.json")
+    parity_parser.add_argument("--limit", type=int, default=500)
+    parity_parser.add_argument("--batch-size", type=int, default=64)
+    parity_parser.add_argument("--threshold", type=float, default=80)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_onnx(args.model_dir, args.output, args.opset)
+    elif args.command == "quantize":
+        quantize_onnx(args.input, args.output)
+    else:
+        options = {"onnx_model": args.onnx_model} if args.backend == "onnx" else {}
+        ok = parity(args.words, args.backend, args.model_dir, args.limit, args.batch_size,
+                    args.threshold, **options)
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
+import asyncio
+import random
+import httpx
 import requests
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set
 import json
 from util import load_config
 import re
@@ -11,6 +14,9 @@ class AzureOpenAI:
         self.api_version = config["api_version"]
         self.api_key = config["api_key"]
         self.deployment_name = config["deployment_name"]
+        # 复用连接，避免每次请求都重新握手
+        self.session = requests.Session()
+        self.timeout = (float(config.get("connect_timeout", 3)), float(config.get("read_timeout", 20)))
     
     def chat_completion(
         self,
@@ -55,15 +61,154 @@ class AzureOpenAI:
         }
         
         try:
-            response = requests.post(url, headers=headers, json=payload)
+            response = self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
             response.raise_for_status()  # 检查响应状态
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"API 请求失败: {str(e)}")
             raise
 
+class AsyncAzureOpenAI:
+    """
+    异步 Azure OpenAI 客户端
+
+    - 持久化连接池（HTTP/1.1 keep-alive，可选 HTTP/2），不再每次请求都做 TCP+TLS 握手
+    - 连接/读取超时，慢请求不会无限占用资源
+    - 限制同时在途的请求数
+    - 对网络错误、429 和 5xx 做带随机抖动的指数退避重试
+    base_url 可以指向本地的 openai_stub_server.py 做测试
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self):
+        config = load_config("azure_openai")
+        self.api_base = config["base_url"]
+        self.api_version = config["api_version"]
+        self.api_key = config["api_key"]
+        self.deployment_name = config["deployment_name"]
+
+        self.timeout = httpx.Timeout(
+            connect=float(config.get("connect_timeout", 3)),
+            read=float(config.get("read_timeout", 20)),
+            write=10.0,
+            pool=float(config.get("pool_timeout", 10))
+        )
+        self.max_in_flight = int(config.get("max_in_flight", 16))
+        self.max_retries = int(config.get("max_retries", 2))
+        self.backoff_base = float(config.get("backoff_base", 0.5))
+        self.http2 = config.get("http2", "false").lower() == "true"
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.api_base,
+                headers={"Content-Type": "application/json", "api-key": self.api_key},
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_in_flight,
+                    max_keepalive_connections=self.max_in_flight
+                ),
+                http2=self.http2
+            )
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._client
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), 30.0)
+            except ValueError:
+                pass
+        # 全抖动指数退避
+        return random.uniform(0, self.backoff_base * (2 ** attempt))
+
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        top_p: float = 0.95,
+        frequency_penalty: float = 0,
+        presence_penalty: float = 0,
+        max_tokens: int = 800,
+        stop: Optional[List[str]] = None,
+        response_format: Optional[Dict] = None
+    ) -> Dict:
+        """
+        异步发送请求到 Azure OpenAI API，参数同 AzureOpenAI.chat_completion
+
+        Args:
+            response_format: 输出格式，例如 {"type": "json_object"}
+        """
+        client = self._get_client()
+        url = f"/openai/deployments/{self.deployment_name}/chat/completions"
+        payload = {
+            "messages": messages,
+            "temperature": temperature,
+            "top_p": top_p,
+            "frequency_penalty": frequency_penalty,
+            "presence_penalty": presence_penalty,
+            "max_tokens": max_tokens,
+            "stop": stop
+        }
+        if response_format:
+            payload["response_format"] = response_format
+
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                for attempt in range(self.max_retries + 1):
+                    self.requests += 1
+                    try:
+                        response = await client.post(url, params={"api-version": self.api_version}, json=payload)
+                    except httpx.TransportError as e:
+                        if attempt == self.max_retries:
+                            self.failures += 1
+                            print(f"API 请求失败: {str(e)}")
+                            raise
+                        self.retries += 1
+                        await asyncio.sleep(self._backoff(attempt))
+                        continue
+
+                    if response.status_code in self.RETRY_STATUS and attempt < self.max_retries:
+                        self.retries += 1
+                        await asyncio.sleep(self._backoff(attempt, response.headers.get("retry-after")))
+                        continue
+
+                    try:
+                        response.raise_for_status()
+                    except httpx.HTTPStatusError as e:
+                        self.failures += 1
+                        print(f"API 请求失败: {str(e)}")
+                        raise
+                    return response.json()
+            finally:
+                self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
 # 创建单例实例
 azure_openai = AzureOpenAI()
+async_azure_openai = AsyncAzureOpenAI()
 
 def get_chat_completion(
     messages: List[Dict[str, str]],
@@ -86,32 +231,234 @@ def get_chat_completion(
         print(f"获取 AI 回复失败: {str(e)}")
         raise
 
-def calculate_similarity_openai(text1, text2):
-    messages = [
+async def get_chat_completion_async(
+    messages: List[Dict[str, str]],
+    **kwargs
+) -> str:
+    """
+    get_chat_completion 的异步版本
+    """
+    try:
+        response = await async_azure_openai.chat_completion(messages, **kwargs)
+        return response['choices'][0]['message']['content']
+    except Exception as e:
+        print(f"获取 AI 回复失败: {str(e)}")
+        raise
+
+SIMILARITY_SYSTEM_PROMPT = "请比较一下如下中文回答和答案的意思,回答以 '回答:'开始，以'.'结束， 答案以'答案:' 开始, 后面的都是答案。的语义相似度，一模一样就是100分，完全不一样就是0分，请根据语义相似性给出分数。答案可能包含多个意思，用','或者';'分隔。如果回答跟答案中某一个意思相似，也请给出90分以上的分数。"
+
+# 单条和批量判分使用相同的温度，开启批量判分不改变打分
+SIMILARITY_TEMPERATURE = 0.7
+
+def _similarity_messages(text1, text2) -> List[Dict[str, str]]:
+    return [
         {
             "role": "system",
-            "content": "请比较一下如下中文回答和答案的意思,回答以 '回答:'开始，以'.'结束， 答案以'答案:' 开始, 后面的都是答案。的语义相似度，一模一样就是100分，完全不一样就是0分，请根据语义相似性给出分数。答案可能包含多个意思，用','或者';'分隔。如果回答跟答案中某一个意思相似，也请给出90分以上的分数。"
+            "content": SIMILARITY_SYSTEM_PROMPT
         },
         {
             "role": "user",
             "content": f"回答: {text1}. 答案: {text2}"
         }
     ]
+
+def _parse_similarity(text1, text2, response: str) -> float:
+    pattern = r'[-+]?\d*\.?\d+'
+    match = re.search(pattern, response)
+    if match:
+        similarity = float(match.group())
+        print(f"回答: {text1} 与答案: {text2} 的相似度: {similarity}")
+        return similarity
+    else:
+        print(f"相似度找不到: {response}")
+        return 0
+
+def calculate_similarity_openai(text1, text2):
+    messages = _similarity_messages(text1, text2)
     
     try:
-        response = get_chat_completion(messages)
-        pattern = r'[-+]?\d*\.?\d+'
-        match = re.search(pattern, response)
-        if match:
-            similarity = float(match.group())
-            print(f"回答: {text1} 与答案: {text2} 的相似度: {similarity}")
-            return similarity
-        else:
-            print(f"相似度找不到: {response}")
-            return 0
+        response = get_chat_completion(messages, temperature=SIMILARITY_TEMPERATURE)
+        return _parse_similarity(text1, text2, response)
     except Exception as e:
         print(f"错误: {str(e)}") 
 
+async def calculate_similarity_openai_async(text1, text2):
+    """calculate_similarity_openai 的异步版本，使用连接池复用的异步客户端"""
+    messages = _similarity_messages(text1, text2)
+    
+    try:
+        response = await get_chat_completion_async(messages, temperature=SIMILARITY_TEMPERATURE)
+        return _parse_similarity(text1, text2, response)
+    except Exception as e:
+        print(f"错误: {str(e)}")
+
+BATCH_SIMILARITY_SYSTEM_PROMPT = SIMILARITY_SYSTEM_PROMPT + "下面会给出多组带编号的回答和答案，请对每一组分别打分。只输出 JSON，格式为 {\"scores\": [{\"id\": 编号, \"score\": 分数}]}，不要输出其他内容。"
+
+def _batch_similarity_messages(pairs) -> List[Dict[str, str]]:
+    lines = [f"{i}. 回答: {text1}. 答案: {text2}" for i, (text1, text2) in enumerate(pairs, 1)]
+    return [
+        {
+            "role": "system",
+            "content": BATCH_SIMILARITY_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": "\n".join(lines)
+        }
+    ]
+
+def _parse_batch_scores(response: str) -> Dict[int, float]:
+    """解析批量打分结果，返回 编号 -> 分数，解析不了的编号不会出现在结果中"""
+    content = response.strip()
+    if content.startswith("```"):
+        content = content.strip("`")
+        content = content[content.find("{"):]
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return {}
+    items = data.get("scores", []) if isinstance(data, dict) else data
+    scores = {}
+    for item in items if isinstance(items, list) else []:
+        try:
+            scores[int(item["id"])] = float(item["score"])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return scores
+
+def _resolve_all(batch: list, score: Optional[float] = None) -> None:
+    """给尚未完成的判分结果设置默认值，避免调用方一直等待"""
+    for _, future in batch:
+        if not future.done():
+            future.set_result(score)
+
+
+class BatchingLLMGrader:
+    """
+    批量大模型判分
+
+    在短时间窗口内收集待判分的 (回答, 答案)，编号后放进一个请求里，
+    固定的系统提示只发送一次。回复按 JSON 解析出每一组的分数，
+    解析失败的条目单独重试。
+    """
+
+    def __init__(self, max_batch_size: int = 20, max_wait_ms: float = 50):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # 正在处理的批次和单条重试任务，保持引用避免被回收，关闭时取消
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.items = 0
+        self.retried_items = 0
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def grade(self, text1: str, text2: str) -> Optional[float]:
+        """判分，返回 0-100 的分数，失败返回 None"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((text1, text2), future))
+        return await future
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        try:
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            _resolve_all(batch)
+            raise
+        return batch
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            # 每一批独立处理，不阻塞下一批的收集
+            self._spawn(self._grade_batch(batch))
+
+    async def _grade_batch(self, batch: list) -> None:
+        try:
+            await self._grade_batch_items(batch)
+        except asyncio.CancelledError:
+            _resolve_all(batch)
+            raise
+
+    async def _grade_batch_items(self, batch: list) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        pairs = [pair for pair, _ in batch]
+
+        scores: Dict[int, float] = {}
+        if len(batch) > 1:
+            try:
+                response = await get_chat_completion_async(
+                    _batch_similarity_messages(pairs),
+                    temperature=SIMILARITY_TEMPERATURE,
+                    response_format={"type": "json_object"}
+                )
+                scores = _parse_batch_scores(response)
+            except Exception as e:
+                print(f"批量判分失败，逐条重试: {str(e)}")
+
+        for i, (pair, future) in enumerate(batch, 1):
+            if i in scores:
+                print(f"回答: {pair[0]} 与答案: {pair[1]} 的相似度: {scores[i]}")
+                if not future.done():
+                    future.set_result(scores[i])
+                continue
+            if len(batch) > 1:
+                self.retried_items += 1
+            self._spawn(self._grade_single(pair, future))
+
+    async def _grade_single(self, pair, future: asyncio.Future) -> None:
+        try:
+            score = await calculate_similarity_openai_async(*pair)
+        except asyncio.CancelledError:
+            _resolve_all([(pair, future)])
+            raise
+        if not future.done():
+            future.set_result(score)
+
+    async def close(self) -> None:
+        """停止收集，取消进行中的判分，等待中的调用方得到 None"""
+        tasks = list(self._tasks)
+        if self._worker is not None:
+            tasks.append(self._worker)
+            self._worker = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._queue is not None:
+            while not self._queue.empty():
+                _resolve_all([self._queue.get_nowait()])
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+            "retried_items": self.retried_items,
+        }
+
 # 使用示例
 if __name__ == "__main__":
     messages = [
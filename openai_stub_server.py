@@ -0,0 +1,63 @@
+"""
+本地 Azure OpenAI 替身服务，用于测试和压测，不消耗真实额度
+
+把 application.properties 中 [azure_openai] base_url 指向本服务即可，例如:
+    base_url=http://127.0.0.1:8001
+
+启动:
+    uvicorn openai_stub_server:app --port 8001
+
+环境变量:
+    STUB_SCORE      : 返回的分数，默认 90
+    STUB_DELAY_MS   : 每次响应前的延迟，默认 200
+    STUB_ERROR_RATE : 返回 503 的概率，用来验证重试，默认 0
+"""
+import asyncio
+import json
+import os
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI()
+
+SCORE = float(os.getenv("STUB_SCORE", "90"))
+DELAY_MS = float(os.getenv("STUB_DELAY_MS", "200"))
+ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+
+stats = {"requests": 0, "errors": 0}
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def chat_completions(deployment: str, request: Request):
+    stats["requests"] += 1
+    body = await request.json()
+    await asyncio.sleep(DELAY_MS / 1000)
+
+    if random.random() < ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse(status_code=503, content={"error": "stub unavailable"})
+
+    content = f"{SCORE:g}"
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        # 批量判分请求：对用户消息中每一行编号的回答打分
+        user_content = body["messages"][-1]["content"]
+        ids = [line.split(".", 1)[0] for line in user_content.splitlines() if line.split(".", 1)[0].isdigit()]
+        content = json.dumps({"scores": [{"id": int(i), "score": SCORE} for i in ids]})
+
+    return {
+        "id": "stub",
+        "object": "chat.completion",
+        "model": deployment,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content}
+        }]
+    }
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
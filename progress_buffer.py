@@ -0,0 +1,110 @@
+"""
+学习进度写缓冲（write-behind）
+
+/api/next-word 每次都会更新 users.current_word_index，快速翻词的用户会产生大量
+单行写事务。开启写缓冲后，最新进度先记在内存里并直接用于读取，定时（以及进程退出时）
+用一条多行 UPDATE 批量写回 MySQL。
+
+进程异常退出最多丢失 flush_interval 秒内的进度。多个 worker 时进度只缓冲在处理请求的
+worker 中，需要会话粘滞或只在单 worker 部署时开启。
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class ProgressBuffer:
+    def __init__(self, writer: Callable[[Dict[str, int]], Awaitable[int]],
+                 flush_interval: float = 2.0, max_pending: int = 1000):
+        """
+        Args:
+            writer: 批量写回函数，参数为 用户名 -> 单词索引
+            flush_interval: 定时写回间隔（秒），即最大丢失窗口
+            max_pending: 待写回用户数超过该值时立即写回
+        """
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending: Dict[str, int] = {}
+        self._flushing: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        # 超过 max_pending 时触发的立即写回，同一时刻最多一个
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+        self.updates = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+
+    def get(self, username: str) -> Optional[int]:
+        """读取尚未写回的最新进度，没有则返回 None"""
+        index = self._pending.get(username)
+        if index is None:
+            index = self._flushing.get(username)
+        return index
+
+    def set(self, username: str, index: int) -> None:
+        """记录最新进度，同一用户在一个写回周期内只保留最后一次"""
+        self._pending[username] = index
+        self.updates += 1
+        if len(self._pending) >= self.max_pending and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> int:
+        """把待写回的进度批量写入数据库"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            self._flushing, self._pending = self._pending, {}
+            try:
+                written = await self.writer(self._flushing)
+                self.flushes += 1
+                self.rows_written += written
+                return written
+            except Exception as e:
+                self.failures += 1
+                print(f"进度写回失败，稍后重试: {e}")
+                # 写回失败时放回待写队列，期间更新的进度优先
+                for username, index in self._flushing.items():
+                    self._pending.setdefault(username, index)
+                return 0
+            finally:
+                self._flushing = {}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """启动定时写回任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止定时写回，并把剩余进度写回数据库"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flush_task is not None:
+            await self._flush_task
+            self._flush_task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "flush_interval": self.flush_interval,
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "writes_saved": self.updates - self.rows_written,
+            "failures": self.failures,
+        }
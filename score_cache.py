@@ -0,0 +1,250 @@
+"""
+相似度分数缓存
+
+进程内 LRU + SQLite(WAL 模式) 持久化存储:
+- 多个 uvicorn worker 可以同时读写同一个数据库文件
+- 按条数和 TTL 淘汰，缓存不会无限增长
+- 缓存 key 去掉首尾空白和标点，"放弃。" 和 " 放弃 " 命中同一条
+- 数据库在 open() 时才打开；async 接口把 SQLite 读写放到专用线程池，不阻塞事件循环
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from util import load_config
+
+# 每写入多少次检查一次淘汰
+EVICT_EVERY = 500
+
+
+def _is_trim_char(ch: str) -> bool:
+    return ch.isspace() or unicodedata.category(ch).startswith("P")
+
+
+def normalize_text(text: str) -> str:
+    """去掉首尾空白和标点，合并中间连续空白"""
+    if not text:
+        return ""
+    start, end = 0, len(text)
+    while start < end and _is_trim_char(text[start]):
+        start += 1
+    while end > start and _is_trim_char(text[end - 1]):
+        end -= 1
+    return " ".join(text[start:end].split())
+
+
+def make_cache_key(answer: str, correct_meaning: str) -> str:
+    """生成缓存 key"""
+    return f"{normalize_text(answer)}@{correct_meaning.strip()}"
+
+
+class ScoreCache:
+    def __init__(self, path: str = "similarity_cache.db", memory_entries: int = 10000,
+                 max_entries: int = 200000, ttl_seconds: float = 30 * 24 * 3600,
+                 legacy_json: Optional[str] = None):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.legacy_json = legacy_json
+
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._opened = False
+        self._local = threading.local()
+        # SQLite 读写专用线程池，每个线程一个连接
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="score-cache")
+        self._writes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def open(self) -> None:
+        """创建表并导入旧的 json 缓存，可以重复调用"""
+        with self._open_lock:
+            if self._opened:
+                return
+            self._init_db()
+            if self.legacy_json:
+                self.import_json(self.legacy_json)
+            self._opened = True
+
+    async def open_async(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.open)
+
+    def _db(self) -> sqlite3.Connection:
+        if not self._opened:
+            self.open()
+        return self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite 连接不能跨线程共享，每个线程一个连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS scores (
+                key TEXT PRIMARY KEY,
+                score REAL NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_scores_created_at ON scores (created_at)")
+
+    def import_json(self, json_path: str) -> int:
+        """导入旧的 similarity_cache.json，只在数据库为空时导入"""
+        if not os.path.exists(json_path):
+            return 0
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM scores LIMIT 1").fetchone():
+            return 0
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取旧缓存文件失败: {e}")
+            return 0
+
+        now = time.time()
+        rows = {}
+        for key, score in legacy.items():
+            answer, _, meaning = key.partition("@")
+            rows[make_cache_key(answer, meaning)] = (float(score), now)
+        conn.executemany(
+            "INSERT OR IGNORE INTO scores (key, score, created_at) VALUES (?, ?, ?)",
+            [(key, score, created_at) for key, (score, created_at) in rows.items()]
+        )
+        print(f"已导入旧缓存 {len(rows)} 条: {json_path}")
+        return len(rows)
+
+    def _remember(self, key: str, score: float, created_at: float) -> None:
+        with self._lock:
+            self._lru[key] = (score, created_at)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.memory_entries:
+                self._lru.popitem(last=False)
+
+    def _memory_get(self, key: str, now: float) -> Optional[float]:
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl_seconds:
+                    self._lru.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._lru[key]
+        return None
+
+    def _disk_get(self, key: str, now: float) -> Optional[float]:
+        row = self._db().execute(
+            "SELECT score, created_at FROM scores WHERE key = ? AND created_at >= ?",
+            (key, now - self.ttl_seconds)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, row[0], row[1])
+        return row[0]
+
+    def _disk_set(self, key: str, score: float, now: float) -> None:
+        self._db().execute(
+            "INSERT OR REPLACE INTO scores (key, score, created_at) VALUES (?, ?, ?)",
+            (key, score, now)
+        )
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def get(self, key: str) -> Optional[float]:
+        """读取缓存分数，过期或不存在返回 None"""
+        now = time.time()
+        score = self._memory_get(key, now)
+        if score is not None:
+            return score
+        return self._disk_get(key, now)
+
+    def set(self, key: str, score: float) -> None:
+        """写入缓存分数"""
+        now = time.time()
+        self._remember(key, score, now)
+        self._disk_set(key, score, now)
+
+    async def get_async(self, key: str) -> Optional[float]:
+        """get 的异步版本，内存命中直接返回，查询 SQLite 时不阻塞事件循环"""
+        now = time.time()
+        score = self._memory_get(key, now)
+        if score is not None:
+            return score
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._disk_get, key, now)
+
+    async def set_async(self, key: str, score: float) -> None:
+        """set 的异步版本，先更新内存，SQLite 写入（以及 busy_timeout 等待）在线程池中进行"""
+        now = time.time()
+        self._remember(key, score, now)
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._disk_set, key, score, now)
+
+    def evict(self) -> int:
+        """删除过期条目，并把总条数裁剪到 max_entries 以内（先删最旧的）"""
+        conn = self._db()
+        removed = conn.execute(
+            "DELETE FROM scores WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+        ).rowcount
+        removed += conn.execute("""
+            DELETE FROM scores WHERE key IN (
+                SELECT key FROM scores ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,)).rowcount
+        self.evicted += removed
+        return removed
+
+    def is_available(self) -> bool:
+        """缓存数据库是否可用"""
+        try:
+            self._db().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def stats(self) -> dict:
+        """命中率统计"""
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / total, 4) if total else 0,
+            "memory_entries": len(self._lru),
+            "evicted": self.evicted,
+        }
+
+
+def create_score_cache() -> ScoreCache:
+    """按配置 [cache] 创建分数缓存，数据库在 open() 或第一次使用时才打开，并导入旧的 json 缓存"""
+    config = load_config("cache", required=False)
+    return ScoreCache(
+        path=config.get("path", "similarity_cache.db"),
+        memory_entries=int(config.get("memory_entries", 10000)),
+        max_entries=int(config.get("max_entries", 200000)),
+        ttl_seconds=float(config.get("ttl_days", 30)) * 24 * 3600,
+        legacy_json=config.get("legacy_json", "similarity_cache.json"),
+    )
@@ -0,0 +1,37 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    合并相同 key 的并发请求
+
+    同一时刻相同 key 只执行一次计算，其他请求等待同一个结果。
+    计算在独立的 task 中执行，发起请求的客户端断开也不会取消其他等待者的结果。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            self.executed += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """合并统计，shared 即避免的重复计算次数"""
+        return {
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "shared": self.shared,
+        }
@@ -15,9 +15,12 @@ from time import mktime
 import _thread as thread
 import os
 from util import load_config
+from audio_store import audio_path, write_audio
 import threading
 import asyncio
-from pathlib import Path
+from typing import Optional
+
+import websockets
  
 STATUS_FIRST_FRAME = 0  # 第一帧的标识
 STATUS_CONTINUE_FRAME = 1  # 中间帧标识
@@ -43,8 +46,7 @@ class Ws_Param(object):
         #self.Data = {"status": 2, "text": str(base64.b64encode(self.Text.encode('utf-16')), "UTF8")}
  
     # 生成url
-    def create_url(self):
-        url = 'wss://tts-api.xfyun.cn/v2/tts'
+    def create_url(self, url='wss://tts-api.xfyun.cn/v2/tts'):
         # 生成RFC1123格式的时间戳
         now = datetime.now()
         date = format_date_time(mktime(now.timetuple()))
@@ -79,7 +81,7 @@ class SpeechGenerator:
     def __init__(self):
         self.completion_event = threading.Event()
         self.error = None
-        self.output_path = None
+        self.frames = []
 
 def on_message(ws, message):
     try:
@@ -89,22 +91,16 @@ def on_message(ws, message):
         audio = base64.b64decode(audio)
         status = message["data"]["status"]
         
-        # 确保speech目录存在
-        Path("./speech").mkdir(exist_ok=True)
-        output_path = f"./speech/{ws.text}.mp3"
-        
         if code != 0:
             ws.speech_generator.error = f"错误码：{code}, 错误信息：{message['message']}"
             ws.speech_generator.completion_event.set()
             ws.close()
             return
             
-        with open(output_path, 'ab') as f:
-            f.write(audio)
+        ws.speech_generator.frames.append(audio)
         
         if status == 2:
             print("------>文本合成结束")
-            ws.speech_generator.output_path = output_path
             ws.speech_generator.completion_event.set()
             ws.close()
 
@@ -135,8 +131,6 @@ def on_open(ws):
         d = json.dumps(d)
         print("------>开始发送文本数据")
         ws.send(d)
-        if os.path.exists(f"./speech/{ws.text}.mp3"):
-            os.remove(f"./speech/{ws.text}.mp3")
  
     thread.start_new_thread(run, ())
  
@@ -180,11 +174,106 @@ def generate_speech_sync(text):
     if speech_generator.error:
         raise Exception(speech_generator.error)
     
-    return speech_generator.output_path
+    # 与 AudioStore 使用相同的分目录文件名，先写临时文件再原子替换
+    output_path = _speech_path(text)
+    write_audio(output_path, b"".join(speech_generator.frames))
+    return output_path
+
+def _speech_path(text):
+    return audio_path(load_config('audio', required=False).get('dir', 'speech'), text)
 
-# 如果./speech/text.mp3存在，则返回文件路径，否则生成语音文件
+# 如果音频文件存在，则返回文件路径，否则生成语音文件
 def text_to_speech(text):
-    if os.path.exists(f"./speech/{text}.mp3"):
-        return f"./speech/{text}.mp3"
+    output_path = _speech_path(text)
+    if os.path.exists(output_path):
+        return output_path
     else:
-        return generate_speech_sync(text)
\ No newline at end of file
+        return generate_speech_sync(text)
+
+
+class AsyncXfyunTTS:
+    """
+    讯飞语音合成的 asyncio 客户端
+
+    - 在事件循环中直接收发 websocket 消息，不再为每个请求启动线程
+    - 限制同时合成的请求数，超出的请求排队等待
+    - 每个请求有总的截止时间（包括排队），超时抛出 TimeoutError
+    - 音频帧收集在内存中，合成完成后一次性返回
+    [xfyun] url 可以指向本地的 xfyun_stub_server.py 做测试
+    """
+
+    def __init__(self):
+        config = load_config('xfyun')
+        self.appid = config['appid']
+        self.apikey = config['apikey']
+        self.apisecret = config['apisecret']
+        self.url = config.get('url', 'wss://tts-api.xfyun.cn/v2/tts')
+        self.timeout = float(config.get('timeout', 50))
+        self.max_concurrency = int(config.get('max_concurrency', 4))
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.audio_bytes = 0
+
+    async def _synthesize(self, text: str) -> bytes:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                wsParam = Ws_Param(APPID=self.appid, APIKey=self.apikey, APISecret=self.apisecret, Text=text)
+                async with websockets.connect(wsParam.create_url(self.url), max_size=None) as ws:
+                    await ws.send(json.dumps({
+                        "common": wsParam.CommonArgs,
+                        "business": wsParam.BusinessArgs,
+                        "data": wsParam.Data,
+                    }))
+                    frames = []
+                    async for raw in ws:
+                        message = json.loads(raw)
+                        if message["code"] != 0:
+                            raise Exception(f"错误码：{message['code']}, 错误信息：{message['message']}")
+                        frames.append(base64.b64decode(message["data"]["audio"]))
+                        if message["data"]["status"] == STATUS_LAST_FRAME:
+                            return b"".join(frames)
+                    raise Exception("语音合成连接提前关闭")
+            finally:
+                self.in_flight -= 1
+
+    async def synthesize(self, text: str) -> bytes:
+        """合成语音，返回 mp3 音频数据"""
+        self.requests += 1
+        try:
+            audio = await asyncio.wait_for(self._synthesize(text), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.failures += 1
+            raise TimeoutError(f"语音生成超时（{self.timeout:g} 秒）")
+        except Exception:
+            self.failures += 1
+            raise
+        self.audio_bytes += len(audio)
+        return audio
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "audio_bytes": self.audio_bytes,
+        }
+
+
+_async_tts: Optional[AsyncXfyunTTS] = None
+
+def async_tts() -> AsyncXfyunTTS:
+    """共享的异步语音合成客户端"""
+    global _async_tts
+    if _async_tts is None:
+        _async_tts = AsyncXfyunTTS()
+    return _async_tts
\ No newline at end of file
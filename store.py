@@ -1,18 +1,20 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, func
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, func, text, update, case, select, and_, or_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime
 import bcrypt
-from typing import Optional
+from typing import Optional, Iterable, Tuple, List, Dict
 from migrator import run_migrations
 from util import load_config
 import json
+import base64
 
 # 获取数据库配置
 config = load_config('database')
 
-def get_database_url(config):
+def get_database_url(config, driver="pymysql"):
     # 从 URL 中解析主机名/IP地址
     # 假设 config['url'] 格式为: "mysql://hostname:3306/dbname?param=value"
     url_parts = config['url'].split('/')
@@ -22,7 +24,7 @@ def get_database_url(config):
     database = url_parts[-1].split('?')[0]
     
     # 构建完整的数据库URL
-    DATABASE_URL = f"mysql+pymysql://{config['username']}:{config['password']}@{host}/{database}?charset=utf8mb4"
+    DATABASE_URL = f"mysql+{driver}://{config['username']}:{config['password']}@{host}/{database}?charset=utf8mb4"
     return DATABASE_URL
 
 # 创建数据库连接
@@ -39,6 +41,7 @@ class User(Base):
     username = Column(String(50), unique=True, index=True)
     password_hash = Column(String(255))
     current_word_index = Column(Integer, default=0)
+    wrong_word_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -64,6 +67,132 @@ class WrongWord(Base):
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+def wrong_word_upsert(username: str, word: str):
+    """
+    错词本插入或累加的单条语句:
+    INSERT ... ON DUPLICATE KEY UPDATE error_count = LAST_INSERT_ID(error_count + 1)
+    借助 LAST_INSERT_ID(expr) 让驱动在同一次往返中带回累加后的次数
+    """
+    stmt = mysql_insert(WrongWord.__table__).values(username=username, word=word, error_count=1)
+    return stmt.on_duplicate_key_update(
+        error_count=func.last_insert_id(WrongWord.__table__.c.error_count + 1),
+        updated_at=func.now()
+    )
+
+def upsert_inserted(result) -> bool:
+    """wrong_word_upsert 是否插入了新行（影响行数 1 为插入，2 为累加已有行）"""
+    return result.rowcount == 1
+
+def upserted_error_count(result) -> int:
+    """从 wrong_word_upsert 的执行结果中取出新的错误次数"""
+    # 新插入时 lastrowid 是自增 id，错误次数为 1；已存在时 lastrowid 是累加后的次数
+    return 1 if upsert_inserted(result) else int(result.lastrowid)
+
+def merge_wrong_word_increments(increments: Iterable[Tuple[str, str, int]]) -> List[dict]:
+    """合并相同 (用户, 单词) 的增量"""
+    merged: Dict[Tuple[str, str], int] = {}
+    for username, word, count in increments:
+        if count > 0:
+            merged[(username, word)] = merged.get((username, word), 0) + count
+    return [
+        {"username": username, "word": word, "error_count": count}
+        for (username, word), count in merged.items()
+    ]
+
+def wrong_word_batch_upsert(rows: List[dict]):
+    """多行插入或累加: error_count = error_count + VALUES(error_count)"""
+    stmt = mysql_insert(WrongWord.__table__).values(rows)
+    return stmt.on_duplicate_key_update(
+        error_count=WrongWord.__table__.c.error_count + stmt.inserted.error_count,
+        updated_at=func.now()
+    )
+
+def wrong_word_increment(username: str, word: str):
+    """已存在的错词错误次数原子加一"""
+    return update(WrongWord).where(
+        WrongWord.username == username,
+        WrongWord.word == word
+    ).values(error_count=WrongWord.error_count + 1, updated_at=func.now())
+
+def word_indexes_update(indexes: Dict[str, int]):
+    """多个用户的单词索引一条 UPDATE 写回: SET current_word_index = CASE username WHEN ... END"""
+    return update(User).where(
+        User.username.in_(list(indexes))
+    ).values(
+        current_word_index=case(indexes, value=User.username),
+        updated_at=datetime.utcnow()
+    )
+
+def wrong_word_count_change(username: str, delta: int):
+    """调整用户的错词数计数（新插入错词 +1，删除错词 -n）"""
+    return update(User).where(User.username == username).values(
+        wrong_word_count=User.wrong_word_count + delta
+    )
+
+def wrong_word_counts_refresh(usernames: Iterable[str]):
+    """批量写入后重新统计涉及用户的错词数（多行 upsert 无法区分每个用户插入了几行）"""
+    return update(User).where(User.username.in_(list(usernames))).values(
+        wrong_word_count=select(func.count()).select_from(WrongWord).where(
+            WrongWord.username == User.username
+        ).scalar_subquery()
+    )
+
+def encode_wrong_list_cursor(row: dict) -> str:
+    """用一页最后一条错词生成下一页的游标"""
+    updated_at = row["updated_at"]
+    payload = [row["error_count"], updated_at.isoformat() if updated_at else None, row["word"]]
+    return base64.urlsafe_b64encode(json.dumps(payload, ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+def decode_wrong_list_cursor(cursor: str) -> Tuple[int, datetime, str]:
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        error_count, updated_at, word = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return int(error_count), datetime.fromisoformat(updated_at), str(word)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+def wrong_list_query(username: str, page_size: int, page: int = 1, cursor: Optional[str] = None):
+    """
+    错词列表查询，按 (error_count, updated_at, word) 倒序，对应索引 idx_wrong_words_username_error_count_updated_at
+
+    传入 cursor 时使用游标分页（(error_count, updated_at, word) < 游标），
+    耗时与错词总数和翻页深度无关；否则按 page 使用 OFFSET 分页
+    """
+    query = select(WrongWord).where(WrongWord.username == username).order_by(
+        WrongWord.error_count.desc(), WrongWord.updated_at.desc(), WrongWord.word.desc()
+    ).limit(page_size)
+    if cursor:
+        error_count, updated_at, word = decode_wrong_list_cursor(cursor)
+        # MySQL 不会把行构造器比较 (a, b, c) < (x, y, z) 转成索引范围扫描，这里写成展开形式，
+        # 并显式加上 error_count <= x 作为范围起点
+        query = query.where(
+            WrongWord.error_count <= error_count,
+            or_(
+                WrongWord.error_count < error_count,
+                and_(
+                    WrongWord.error_count == error_count,
+                    or_(
+                        WrongWord.updated_at < updated_at,
+                        and_(WrongWord.updated_at == updated_at, WrongWord.word < word)
+                    )
+                )
+            )
+        )
+    elif cursor is None:
+        query = query.offset((page - 1) * page_size)
+    return query
+
+def wrong_word_to_dict(w: "WrongWord") -> dict:
+    return {
+        "word": w.word,
+        "error_count": w.error_count,
+        "created_at": w.created_at,
+        "updated_at": w.updated_at
+    }
+
+# 批量更新每条语句最多包含的用户数
+BATCH_UPDATE_SIZE = 500
+
 class UserStore:
 
     @staticmethod
@@ -120,6 +249,22 @@ class UserStore:
         finally:
             db.close()
 
+    @staticmethod
+    def update_word_indexes(indexes: Dict[str, int]) -> int:
+        """批量更新多个用户的单词索引，返回更新的行数"""
+        items = list(indexes.items())
+        updated = 0
+        with SessionLocal() as db:
+            try:
+                for start in range(0, len(items), BATCH_UPDATE_SIZE):
+                    chunk = dict(items[start:start + BATCH_UPDATE_SIZE])
+                    updated += db.execute(word_indexes_update(chunk)).rowcount
+                db.commit()
+                return updated
+            except SQLAlchemyError as e:
+                db.rollback()
+                raise e
+
     @staticmethod
     def get_word_index(username: str) -> Optional[int]:
         """获取用户的当前单词索引"""
@@ -132,31 +277,39 @@ class UserStore:
 
     @staticmethod
     def add_to_wrong_list(username: str, word: str) -> Optional[int]:
-        """添加单词到错词本，如果已存在则增加错误次数"""
+        """添加单词到错词本，如果已存在则增加错误次数，返回新的错误次数"""
         with SessionLocal() as db:
             try:
-                count = 0
-                # 查找是否已存在
-                wrong_word = db.query(WrongWord).filter(
-                    WrongWord.username == username,
-                    WrongWord.word == word
-                ).first()
+                result = db.execute(wrong_word_upsert(username, word))
+                error_count = upserted_error_count(result)
+                if upsert_inserted(result):
+                    db.execute(wrong_word_count_change(username, 1))
+                db.commit()
+                return error_count
+            except SQLAlchemyError as e:
+                db.rollback()
+                raise e
 
-                if wrong_word:
-                    # 如果存在，增加错误次数
-                    wrong_word.error_count += 1
-                    wrong_word.updated_at = func.now()
-                    count = wrong_word.error_count
-                else:
-                    # 如果不存在，创建新记录
-                    wrong_word = WrongWord(
-                        username=username,
-                        word=word
-                    )
-                    db.add(wrong_word)
-                    count = 1
+    @staticmethod
+    def add_to_wrong_list_batch(increments: Iterable[Tuple[str, str, int]]) -> int:
+        """
+        批量增加错误次数，一条语句完成所有 (用户, 单词) 的插入或累加
+
+        Args:
+            increments: (username, word, 增加的次数) 列表，同一 (用户, 单词) 可以出现多次
+
+        Returns:
+            int: 涉及的 (用户, 单词) 数量
+        """
+        rows = merge_wrong_word_increments(increments)
+        if not rows:
+            return 0
+        with SessionLocal() as db:
+            try:
+                db.execute(wrong_word_batch_upsert(rows))
+                db.execute(wrong_word_counts_refresh({row["username"] for row in rows}))
                 db.commit()
-                return count
+                return len(rows)
             except SQLAlchemyError as e:
                 db.rollback()
                 raise e
@@ -166,10 +319,12 @@ class UserStore:
         """从错词本中移除单词"""
         with SessionLocal() as db:
             try:
-                db.query(WrongWord).filter(
+                removed = db.query(WrongWord).filter(
                     WrongWord.username == username,
                     WrongWord.word == word
                 ).delete()
+                if removed:
+                    db.execute(wrong_word_count_change(username, -removed))
                 db.commit()
             except SQLAlchemyError as e:
                 db.rollback()
@@ -180,53 +335,33 @@ class UserStore:
         """增加单词的错误次数"""
         with SessionLocal() as db:
             try:
-                wrong_word = db.query(WrongWord).filter(
-                    WrongWord.username == username,
-                    WrongWord.word == word
-                ).first()
-                
-                if wrong_word:
-                    wrong_word.error_count += 1
-                    wrong_word.updated_at = func.now()
-                    db.commit()
+                db.execute(wrong_word_increment(username, word))
+                db.commit()
             except SQLAlchemyError as e:
                 db.rollback()
                 raise e
 
     @staticmethod
-    def get_wrong_list(username: str, page: int = 1, page_size: int = 10) -> list:
-        """获取用户的错词列表，支持分页"""
+    def get_wrong_list(username: str, page: int = 1, page_size: int = 10,
+                       cursor: Optional[str] = None) -> list:
+        """获取用户的错词列表，支持页码分页和游标分页（cursor 为空字符串表示第一页）"""
         with SessionLocal() as db:
             try:
-                offset = (page - 1) * page_size
-                wrong_words = db.query(WrongWord).filter(
-                    WrongWord.username == username
-                ).order_by(
-                    WrongWord.error_count.desc(),
-                    WrongWord.updated_at.desc()
-                ).offset(offset).limit(page_size).all()
-
-                return [
-                    {
-                        "word": w.word,
-                        "error_count": w.error_count,
-                        "created_at": w.created_at,
-                        "updated_at": w.updated_at
-                    } for w in wrong_words
-                ]
+                wrong_words = db.scalars(wrong_list_query(username, page_size, page, cursor)).all()
+                return [wrong_word_to_dict(w) for w in wrong_words]
             except SQLAlchemyError as e:
                 raise e
 
     @staticmethod
     def get_wrong_words_count(username: str) -> int:
-        """获取用户错词总数"""
+        """获取用户错词总数（users.wrong_word_count 计数）"""
         with SessionLocal() as db:
             try:
-                return db.query(WrongWord).filter(
-                    WrongWord.username == username
-                ).count()
+                count = db.scalar(select(User.wrong_word_count).where(User.username == username))
+                return count or 0
             except SQLAlchemyError as e:
                 raise e
+
     @staticmethod
     def get_word_error_count(username: str, word: str) -> int:
         """获取用户某个单词的错误次数"""
@@ -240,7 +375,18 @@ class UserStore:
                 return wrong_word.error_count if wrong_word else 0
             except SQLAlchemyError as e:
                 raise e
+def check_database() -> bool:
+    """检查数据库连接是否可用"""
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except SQLAlchemyError as e:
+        print(f"数据库连接检查失败: {e}")
+        return False
+
 # 创建数据库表
 def init_db():
-    # 运行数据库迁移
-    run_migrations()
\ No newline at end of file
+    # 运行数据库迁移，[migrations] auto_migrate=false 时由部署流程单独执行 python migrator.py
+    if load_config('migrations', required=False).get('auto_migrate', 'true').lower() == 'true':
+        run_migrations()
\ No newline at end of file
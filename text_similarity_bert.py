@@ -1,53 +1,62 @@
-from transformers import BertTokenizer, BertModel
-import torch
-import torch.nn.functional as F
+import numpy as np
 import os
+from inference_backends import create_backend
+from util import load_config, split_meanings
 
 class BertSimilarity:
-    def __init__(self, model_name='bert-base-chinese'):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    def __init__(self, model_name='bert-base-chinese', backend=None):
+        self.model_name = model_name
         # 指定模型目录路径
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        model_dir = os.path.join(current_dir, 'models', 'bert-base-chinese')
+        model_dir = os.path.join(current_dir, 'models', model_name)
         print(f"模型目录: {model_dir}")
-        # 直接使用模型目录路径，而不是模型名称
-        self.tokenizer = BertTokenizer.from_pretrained(
-            model_dir,  # 使用完整路径而不是模型名称
-            cache_dir=model_dir
-        )
-        self.model = BertModel.from_pretrained(
-            model_dir,  # 使用完整路径而不是模型名称
-            cache_dir=model_dir
-        ).to(self.device)
-        print("模型加载成功！")
-        
+
+        # 推理后端可在配置 [bert] backend 中选择: torch / torch_int8 / onnx
+        bert_config = load_config("bert", required=False)
+        backend = backend or bert_config.get("backend", "torch")
+        options = {}
+        if backend == "onnx":
+            if bert_config.get("onnx_model"):
+                options["onnx_model"] = os.path.join(current_dir, bert_config["onnx_model"])
+            options["intra_op_threads"] = int(bert_config.get("onnx_threads", 0))
+        self.backend = create_backend(backend, model_dir, **options)
+        print(f"模型加载成功！推理后端: {self.backend.name}")
+
     def get_text_embedding(self, text):
-        """获取文本的BERT嵌入向量"""
-        inputs = self.tokenizer(text, return_tensors='pt', padding=True, truncation=True, max_length=512)
-        inputs = {k: v.to(self.device) for k, v in inputs.items()}
-        
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            # 使用[CLS]标记的输出作为整个句子的表示
-            embeddings = outputs.last_hidden_state[:, 0, :]
-            # 归一化
-            embeddings = F.normalize(embeddings, p=2, dim=1)
-            
-        return embeddings
-    
+        """获取文本的BERT嵌入向量，返回归一化后的 (文本数, 维度) float32 矩阵"""
+        return self.backend.encode(text)
+
+    def get_text_embeddings(self, texts, batch_size=64):
+        """批量获取多个文本的BERT嵌入向量，同一批次padding后一次前向计算"""
+        results = []
+        for start in range(0, len(texts), batch_size):
+            batch = list(texts[start:start + batch_size])
+            results.append(self.get_text_embedding(batch))
+        return np.concatenate(results, axis=0)
+
+    def warm_up(self, meanings, sample_size=32):
+        """从单词书中均匀抽取释义片段预热模型，覆盖单条和批量两种输入形状，返回预热样本数"""
+        segments = [m for meaning in meanings for m in split_meanings(meaning)]
+        step = max(len(segments) // sample_size, 1)
+        samples = segments[::step][:sample_size] or ["放弃"]
+        self.get_text_embeddings(samples)
+        for text in samples[:4]:
+            self.get_text_embedding([text])
+        return len(samples)
+
     def calculate_similarity(self, text1, text2):
         """计算两个文本的相似度"""
         embedding1 = self.get_text_embedding(text1)
         embedding2 = self.get_text_embedding(text2)
-        
+
         # 计算余弦相似度
-        similarity = torch.mm(embedding1, embedding2.T)
+        similarity = embedding1 @ embedding2.T
         print(f"计算两个文本的相似度: {text1}, {text2} 相似度分数: {similarity[0][0]}")
-        return float(similarity[0][0]) 
+        return float(similarity[0][0])
 
 if __name__ == "__main__":
     similarity = BertSimilarity()
     text1 = "不寻常"
     text2 = "反常的，异常的；变态的"
     score = similarity.calculate_similarity(text1, text2)
-    print(f"相似度分数: {score}")
\ No newline at end of file
+    print(f"相似度分数: {score}")
@@ -0,0 +1,127 @@
+"""
+用户学习状态读穿缓存
+
+缓存每个用户的 当前单词索引、错词错误次数表 和 错词总数。未命中时一次查询加载整个状态，
+之后 /check-answer、/current-word、/progress 等高频接口通常不再访问数据库。
+AsyncUserStore 的写操作会就地更新或失效对应的缓存；按 LRU 和 TTL 淘汰。
+其他进程（其他 worker、脚本）的写入不会通知本进程，最长在 ttl_seconds 后生效，
+因此多 worker 部署时需要会话粘滞，默认不开启。
+"""
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from singleflight import SingleFlight
+
+
+class UserState:
+    def __init__(self, current_word_index: int, error_counts: Dict[str, int]):
+        self.current_word_index = current_word_index
+        self.error_counts = error_counts
+        self.loaded_at = time.monotonic()
+
+    @property
+    def wrong_total(self) -> int:
+        return len(self.error_counts)
+
+
+class UserStateCache:
+    def __init__(self, loader: Callable[[str], Awaitable[Optional[UserState]]],
+                 max_users: int = 10000, ttl_seconds: float = 60):
+        """
+        Args:
+            loader: 从数据库加载用户状态，用户不存在返回 None
+            max_users: 最多缓存的用户数
+            ttl_seconds: 缓存有效期
+        """
+        self.loader = loader
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._states: "OrderedDict[str, UserState]" = OrderedDict()
+        self._loads = SingleFlight()
+        # 正在加载的用户 -> 加载期间是否有写入；有写入时加载结果可能已过期，不放入缓存
+        self._loading: Dict[str, bool] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, username: str) -> Optional[UserState]:
+        state = self._states.get(username)
+        if state is None:
+            return None
+        if time.monotonic() - state.loaded_at > self.ttl_seconds:
+            del self._states[username]
+            return None
+        self._states.move_to_end(username)
+        return state
+
+    async def _load(self, username: str) -> Optional[UserState]:
+        self._loading[username] = False
+        try:
+            state = await self.loader(username)
+        finally:
+            written = self._loading.pop(username)
+        if state is not None and not written:
+            self._states[username] = state
+            self._states.move_to_end(username)
+            while len(self._states) > self.max_users:
+                self._states.popitem(last=False)
+        return state
+
+    async def get(self, username: str) -> Optional[UserState]:
+        """读取用户状态，未命中时从数据库加载（并发加载同一用户只查询一次）"""
+        state = self._cached(username)
+        if state is not None:
+            self.hits += 1
+            return state
+        self.misses += 1
+        return await self._loads.do(username, lambda: self._load(username))
+
+    def _written(self, username: str) -> Optional[UserState]:
+        """写入后调用，返回需要就地更新的缓存状态"""
+        if username in self._loading:
+            self._loading[username] = True
+        return self._cached(username)
+
+    def set_word_index(self, username: str, index: int) -> None:
+        state = self._written(username)
+        if state is not None:
+            state.current_word_index = index
+
+    def set_error_count(self, username: str, word: str, count: int) -> None:
+        state = self._written(username)
+        if state is not None:
+            state.error_counts[word] = count
+
+    def add_error_count(self, username: str, word: str, count: int) -> None:
+        """错词不存在时插入，存在时累加（与批量 upsert 语义一致）"""
+        state = self._written(username)
+        if state is not None:
+            state.error_counts[word] = state.error_counts.get(word, 0) + count
+
+    def increment_error_count(self, username: str, word: str) -> None:
+        """已存在的错词错误次数加一（不存在的错词不会被 UPDATE 插入）"""
+        state = self._written(username)
+        if state is not None and word in state.error_counts:
+            state.error_counts[word] += 1
+
+    def remove_error_count(self, username: str, word: str) -> None:
+        state = self._written(username)
+        if state is not None:
+            state.error_counts.pop(word, None)
+
+    def invalidate(self, username: str) -> None:
+        if username in self._loading:
+            self._loading[username] = True
+        self._states.pop(username, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "users": len(self._states),
+            "max_users": self.max_users,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0,
+        }
@@ -1,10 +1,11 @@
 import os
 import configparser
 
-def load_config(section=None):
+def load_config(section=None, required=True):
     """
     加载配置文件
     :param section: 指定要读取的配置节，如果为None则返回所有配置
+    :param required: 配置节是否必须存在，为False时缺失的配置节返回空字典
     :return: 配置字典
     """
     config = configparser.ConfigParser()
@@ -12,5 +13,21 @@ def load_config(section=None):
     config.read(config_path)
     
     if section:
+        if not required and not config.has_section(section):
+            return {}
         return config[section]
-    return config 
\ No newline at end of file
+    return config
+
+def split_meanings(correct_meaning):
+    """
+    把中文释义拆分成多个含义片段
+    :param correct_meaning: 释义文本，多个含义用中英文分号或逗号分隔
+    :return: 去掉首尾空白后的含义列表
+    """
+    if not correct_meaning:
+        return []
+    return [m.strip() for m in correct_meaning
+            .replace('；', ';')
+            .replace(',', ';')
+            .replace('，', ';')
+            .split(';') if m.strip()]
@@ -0,0 +1,201 @@
+"""
+单词书二进制格式
+
+把 json 单词书和章节文件预编译成一个紧凑的二进制文件，运行时直接 mmap，
+不再 json.load，多个 uvicorn worker 共享同一份 page cache。
+
+文件布局（全部小端）:
+    header   : magic(4s) version word_count chapter_count
+               entries_offset sorted_offset chapters_offset strings_offset  (u32)
+    entries  : word_count 条，每条 4 个字段 (offset u32, length u32)，
+               依次为 word / phonetic / part_of_speech / chinese_meaning，
+               length == MISSING 表示字段不存在
+    sorted   : word_count 个 u32，按单词字节序排序后的索引，用于二分查找
+    chapters : chapter_count 条 (start_word, end_word 各一个 (offset, length),
+               start_index i32, end_index i32)，找不到的单词索引为 -1
+    strings  : utf-8 字符串表
+
+用法:
+    python vocab_binary.py toefl.json chapter.json toefl.bin
+"""
+import json
+import mmap
+import struct
+import sys
+from typing import Dict, List, Optional
+
+MAGIC = b"WQVB"
+VERSION = 1
+MISSING = 0xFFFFFFFF
+FIELDS = ("word", "phonetic", "part_of_speech", "chinese_meaning")
+
+HEADER = struct.Struct("<4sIIIIIII")
+ENTRY = struct.Struct("<" + "II" * len(FIELDS))
+INDEX = struct.Struct("<I")
+CHAPTER = struct.Struct("<IIIIii")
+
+
+class _StringTable:
+    """构建字符串表，相同的字符串只存一份"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self._offsets: Dict[bytes, int] = {}
+
+    def add(self, text: Optional[str]):
+        if text is None:
+            return 0, MISSING
+        raw = text.encode("utf-8")
+        offset = self._offsets.get(raw)
+        if offset is None:
+            offset = len(self.data)
+            self._offsets[raw] = offset
+            self.data += raw
+        return offset, len(raw)
+
+
+def compile_word_book(words: List[Dict], chapters: List[Dict]) -> bytes:
+    """把单词列表和章节列表编译成二进制格式"""
+    strings = _StringTable()
+
+    first_index: Dict[str, int] = {}
+    entries = bytearray()
+    for i, w in enumerate(words):
+        first_index.setdefault(w["word"], i)
+        refs = []
+        for field in FIELDS:
+            refs.extend(strings.add(w.get(field)))
+        entries += ENTRY.pack(*refs)
+
+    # 按单词字节序排序，同一个单词保留原有顺序，保证二分查找命中第一次出现的位置
+    order = sorted(range(len(words)), key=lambda i: (words[i]["word"].encode("utf-8"), i))
+    sorted_index = b"".join(INDEX.pack(i) for i in order)
+
+    chapter_table = bytearray()
+    for chapter in chapters:
+        start_index = first_index.get(chapter["start_word"], -1)
+        end_index = first_index.get(chapter["end_word"], -1)
+        chapter_table += CHAPTER.pack(
+            *strings.add(chapter["start_word"]),
+            *strings.add(chapter["end_word"]),
+            start_index,
+            end_index,
+        )
+
+    entries_offset = HEADER.size
+    sorted_offset = entries_offset + len(entries)
+    chapters_offset = sorted_offset + len(sorted_index)
+    strings_offset = chapters_offset + len(chapter_table)
+    header = HEADER.pack(
+        MAGIC, VERSION, len(words), len(chapters),
+        entries_offset, sorted_offset, chapters_offset, strings_offset,
+    )
+    return header + bytes(entries) + sorted_index + bytes(chapter_table) + bytes(strings.data)
+
+
+def build(word_path: str, chapter_path: str, output_path: str) -> None:
+    """读取 json 单词书和章节文件，写出二进制单词书"""
+    with open(word_path, 'r', encoding='utf-8') as f:
+        words = json.load(f)
+    with open(chapter_path, 'r', encoding='utf-8') as f:
+        chapters = json.load(f)
+
+    data = compile_word_book(words, chapters)
+    with open(output_path, 'wb') as f:
+        f.write(data)
+    print(f"已生成二进制单词书: {output_path}, 单词数: {len(words)}, 章节数: {len(chapters)}, 大小: {len(data)} 字节")
+
+
+class MmapWordBook:
+    """只读的 mmap 单词书，按需解码条目，不把整本书加载进 Python 堆"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.word_count, self.chapter_count,
+         self._entries_offset, self._sorted_offset,
+         self._chapters_offset, self._strings_offset) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"不支持的单词书格式: {path}")
+
+    def _string(self, offset: int, length: int) -> Optional[str]:
+        if length == MISSING:
+            return None
+        start = self._strings_offset + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _field(self, index: int, field: int) -> Optional[str]:
+        offset, length = struct.unpack_from(
+            "<II", self._mm, self._entries_offset + index * ENTRY.size + field * 8
+        )
+        return self._string(offset, length)
+
+    def _word_bytes(self, index: int) -> bytes:
+        offset, length = struct.unpack_from("<II", self._mm, self._entries_offset + index * ENTRY.size)
+        start = self._strings_offset + offset
+        return self._mm[start:start + length]
+
+    def __len__(self) -> int:
+        return self.word_count
+
+    def __getitem__(self, index: int) -> Dict:
+        if index < 0:
+            index += self.word_count
+        if not 0 <= index < self.word_count:
+            raise IndexError("word index out of range")
+        refs = ENTRY.unpack_from(self._mm, self._entries_offset + index * ENTRY.size)
+        entry = {}
+        for i, field in enumerate(FIELDS):
+            value = self._string(refs[2 * i], refs[2 * i + 1])
+            if value is not None:
+                entry[field] = value
+        return entry
+
+    def word(self, index: int) -> str:
+        return self._field(index, 0)
+
+    def meaning(self, index: int) -> Optional[str]:
+        return self._field(index, 3)
+
+    def index_of(self, word: str) -> Optional[int]:
+        """在排序索引上二分查找单词"""
+        target = word.encode("utf-8")
+        lo, hi = 0, self.word_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            (index,) = INDEX.unpack_from(self._mm, self._sorted_offset + mid * INDEX.size)
+            if self._word_bytes(index) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.word_count:
+            (index,) = INDEX.unpack_from(self._mm, self._sorted_offset + lo * INDEX.size)
+            if self._word_bytes(index) == target:
+                return index
+        return None
+
+    def chapters(self) -> List[Dict]:
+        """解码章节表，章节数很少，直接生成列表"""
+        chapters = []
+        for i in range(self.chapter_count):
+            (start_offset, start_length, end_offset, end_length,
+             start_index, end_index) = CHAPTER.unpack_from(self._mm, self._chapters_offset + i * CHAPTER.size)
+            chapters.append({
+                "start_word": self._string(start_offset, start_length),
+                "end_word": self._string(end_offset, end_length),
+                "start_index": start_index if start_index >= 0 else None,
+                "end_index": end_index if end_index >= 0 else None,
+            })
+        return chapters
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        print("用法: python vocab_binary.py <单词书.json> <章节.json> <输出.bin>")
+        sys.exit(1)
+    build(sys.argv[1], sys.argv[2], sys.argv[3])
@@ -0,0 +1,105 @@
+import json
+import os
+from bisect import bisect_right
+from typing import Dict, List, Optional
+from vocab_binary import MmapWordBook
+
+
+class VocabularyCatalog:
+    """
+    单词书目录，启动时构建一次索引，之后所有查找都是 O(1) 或 O(log n)
+
+    - word -> index 哈希表
+    - 章节起始索引有序数组，配合 bisect 定位章节
+    - word -> chinese_meaning 预计算表
+    """
+
+    def __init__(self, words: List[Dict], chapters: List[Dict]):
+        self.words = words
+        self.chapters = chapters
+
+        # 单词可能重复（例如 contact），保持与原先线性查找一致，取第一次出现的位置
+        self._word_index: Dict[str, int] = {}
+        self._meanings: Dict[str, Optional[str]] = {}
+        for i, w in enumerate(words):
+            if w["word"] not in self._word_index:
+                self._word_index[w["word"]] = i
+                self._meanings[w["word"]] = w.get("chinese_meaning")
+
+        for chapter in chapters:
+            chapter["start_index"] = self.index_of(chapter["start_word"])
+            chapter["end_index"] = self.index_of(chapter["end_word"])
+        self._index_chapters()
+
+    def _index_chapters(self) -> None:
+        # 只有起止单词都能找到的章节才参与区间查找，按起始索引排序
+        located = sorted(
+            (chapter["start_index"], chapter["end_index"], idx)
+            for idx, chapter in enumerate(self.chapters)
+            if chapter["start_index"] is not None and chapter["end_index"] is not None
+        )
+        self._chapter_starts = [start for start, _, _ in located]
+        self._chapter_ends = [end for _, end, _ in located]
+        self._chapter_ids = [idx for _, _, idx in located]
+
+    @classmethod
+    def from_json(cls, word_path: str, chapter_path: str) -> "VocabularyCatalog":
+        """从 json 单词书和章节文件构建目录"""
+        with open(word_path, 'r', encoding='utf-8') as f:
+            words = json.load(f)
+        with open(chapter_path, 'r', encoding='utf-8') as f:
+            chapters = json.load(f)
+        return cls(words, chapters)
+
+    @classmethod
+    def from_binary(cls, path: str) -> "VocabularyCatalog":
+        """从 vocab_binary.py 预编译的二进制单词书构建目录（mmap，不解析 json）"""
+        return MmapVocabularyCatalog(MmapWordBook(path))
+
+    @classmethod
+    def load(cls, word_path: str, chapter_path: str, binary_path: str) -> "VocabularyCatalog":
+        """优先使用二进制单词书，不存在或比 json 旧时回退到 json"""
+        if os.path.exists(binary_path) and \
+                os.path.getmtime(binary_path) >= max(os.path.getmtime(word_path), os.path.getmtime(chapter_path)):
+            return cls.from_binary(binary_path)
+        if os.path.exists(binary_path):
+            print(f"二进制单词书已过期，使用 json 加载: {binary_path}")
+        return cls.from_json(word_path, chapter_path)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __getitem__(self, index: int) -> Dict:
+        return self.words[index]
+
+    def index_of(self, word: str) -> Optional[int]:
+        """返回单词在单词书中的索引，找不到返回 None"""
+        return self._word_index.get(word)
+
+    def meaning_of(self, word: str) -> Optional[str]:
+        """返回单词的中文释义，找不到返回 None"""
+        return self._meanings.get(word)
+
+    def chapter_of(self, index: int) -> Optional[int]:
+        """返回单词索引所在章节的序号，不在任何章节 [start_index, end_index) 内返回 None"""
+        pos = bisect_right(self._chapter_starts, index) - 1
+        if pos < 0 or index >= self._chapter_ends[pos]:
+            return None
+        return self._chapter_ids[pos]
+
+
+class MmapVocabularyCatalog(VocabularyCatalog):
+    """基于 mmap 二进制单词书的目录，单词条目按需解码，查找走文件内的排序索引"""
+
+    def __init__(self, book: MmapWordBook):
+        self.words = book
+        self.chapters = book.chapters()
+        self._book = book
+        self._index_chapters()
+
+    def index_of(self, word: str) -> Optional[int]:
+        return self._book.index_of(word)
+
+    def meaning_of(self, word: str) -> Optional[str]:
+        index = self._book.index_of(word)
+        return self._book.meaning(index) if index is not None else None
@@ -0,0 +1,74 @@
+"""
+本地讯飞语音合成替身服务，用于测试和压测，不消耗真实额度
+
+按讯飞 TTS websocket 协议返回若干帧假音频（内容为 "ID3" + 文本），
+把 application.properties 中 [xfyun] url 指向本服务即可，例如:
+    url=ws://127.0.0.1:8002/v2/tts
+
+启动:
+    python xfyun_stub_server.py --port 8002
+
+环境变量:
+    STUB_FRAMES     : 每次合成返回的音频帧数，默认 3
+    STUB_DELAY_MS   : 每帧之间的延迟，默认 50
+    STUB_ERROR_RATE : 返回错误码的概率，默认 0
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+
+import websockets
+
+FRAMES = int(os.getenv("STUB_FRAMES", "3"))
+DELAY_MS = float(os.getenv("STUB_DELAY_MS", "50"))
+ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+
+stats = {"requests": 0, "errors": 0}
+
+
+def _frame(code: int, audio: bytes, status: int, message: str = "success") -> str:
+    return json.dumps({
+        "code": code,
+        "message": message,
+        "sid": "stub",
+        "data": {"audio": base64.b64encode(audio).decode("ascii"), "status": status, "ced": "0"}
+    })
+
+
+async def handle(ws) -> None:
+    stats["requests"] += 1
+    request = json.loads(await ws.recv())
+    text = base64.b64decode(request["data"]["text"]).decode("utf-8")
+
+    if random.random() < ERROR_RATE:
+        stats["errors"] += 1
+        await ws.send(_frame(10313, b"", 2, "stub error"))
+        return
+
+    audio = b"ID3" + text.encode("utf-8")
+    chunk = max(1, -(-len(audio) // FRAMES))
+    chunks = [audio[i:i + chunk] for i in range(0, len(audio), chunk)]
+    for i, part in enumerate(chunks):
+        await asyncio.sleep(DELAY_MS / 1000)
+        await ws.send(_frame(0, part, 2 if i == len(chunks) - 1 else 1))
+
+
+async def serve(host: str, port: int) -> None:
+    async with websockets.serve(handle, host, port):
+        print(f"讯飞语音合成替身服务已启动: ws://{host}:{port}/v2/tts")
+        await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地讯飞语音合成替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()